@@ -59,10 +59,12 @@ from pathmanager import PathManager
 from cachemanager import CacheManager
 from resourcemanager import ResourceManager
 from inputmanager import InputManager
+from audiomanager import AudioManager
 from windowmanager import WindowManager
 from entitymanager import EntityManager
 from areamanager import AreaManager
 from scriptmanager import ScriptManager
+from watchmanager import WatchManager
 
 
 class Driftwood:
@@ -88,9 +90,11 @@ class Driftwood:
             resource: ResourceManager instance.
             input: InputManager instance.
             window: WindowManager instance.
+            audio: AudioManager instance.
             entity: EntityManager instance.
             area: AreaManager instance.
             script: ScriptManager instance.
+            watch: WatchManager instance.
 
             keycode: Contains the SDL keycodes.
 
@@ -105,9 +109,11 @@ class Driftwood:
         self.resource = ResourceManager(self)
         self.input = InputManager(self)
         self.window = WindowManager(self)
+        self.audio = AudioManager(self)
         self.entity = EntityManager(self)
         self.area = AreaManager(self)
         self.script = ScriptManager(self)
+        self.watch = WatchManager(self)
 
         # SDL Keycodes.
         self.keycode = keycode
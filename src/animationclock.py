@@ -0,0 +1,101 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## animationclock.py             ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+class AnimationClock:
+    """This class advances the animation frames of all animated entities in one tick callback.
+
+    Entities are grouped by their animation frames-per-second, and all entities in a group change frames together. The
+    area is marked changed once per tick, if any frame changed.
+
+    Attributes:
+        manager: Parent EntityManager instance.
+    """
+
+    def __init__(self, entitymanager):
+        """AnimationClock class initializer.
+
+        Args:
+            entitymanager: Link back to the parent EntityManager instance.
+        """
+        self.manager = entitymanager
+
+        # Dictionaries of animated entities mapped by eid, and milliseconds into the current frame, mapped by afps.
+        self.__groups = {}
+        self.__elapsed = {}
+
+        # Dictionary of the afps each entity was added at, mapped by eid.
+        self.__afps = {}
+
+    def __contains__(self, ent):
+        return ent.eid in self.__afps
+
+    def add(self, ent):
+        """Start animating an entity at its afps.
+
+        Args:
+            ent: Entity to animate.
+        """
+        self.remove(ent)
+
+        if ent.afps not in self.__groups:
+            self.__groups[ent.afps] = {}
+            self.__elapsed[ent.afps] = 0
+        self.__groups[ent.afps][ent.eid] = ent
+        self.__afps[ent.eid] = ent.afps
+
+    def remove(self, ent):
+        """Stop animating an entity.
+
+        Args:
+            ent: Entity to stop animating.
+        """
+        if ent.eid not in self.__afps:
+            return
+
+        afps = self.__afps.pop(ent.eid)
+        del self.__groups[afps][ent.eid]
+        if not self.__groups[afps]:
+            del self.__groups[afps]
+            del self.__elapsed[afps]
+
+    def tick(self, millis_past):
+        """Tick callback which advances the frames of every group whose frame time has passed.
+        """
+        changed = False
+
+        for afps, group in self.__groups.items():
+            period = max(1, int(1000 // afps))
+            elapsed = self.__elapsed[afps] + millis_past
+            frames, self.__elapsed[afps] = divmod(elapsed, period)
+
+            if frames:
+                for ent in group.values():
+                    ent._animate(frames)
+                changed = True
+
+        if changed:
+            self.manager.driftwood.area.changed = True
@@ -26,6 +26,7 @@
 
 from sdl2 import *
 
+import pathfinder
 import tilemap
 
 
@@ -36,7 +37,9 @@ class AreaManager:
 
     Attributes:
         driftwood: Base class instance.
+        filename: Filename of the current area's Tiled map file.
         tilemap: Tilemap instance for the area's tilemap.
+        pathfinder: Pathfinder instance for the area's layers.
         changed: Whether the area should be rebuilt.
     """
     def __init__(self, driftwood):
@@ -47,7 +50,10 @@ class AreaManager:
         """
         self.driftwood = driftwood
 
+        self.filename = ""
+
         self.tilemap = tilemap.Tilemap(self)
+        self.pathfinder = pathfinder.Pathfinder(self)
 
         self.changed = False
 
@@ -70,9 +76,17 @@ class AreaManager:
             True if succeeded, False if failed.
         """
         if filename in self.driftwood.resource:
+            # Kill the entities the last area spawned, before this one spawns its own.
+            for eid in self.tilemap.spawned:
+                self.driftwood.entity.kill(eid)
+
+            self.filename = filename
             self.tilemap._read(self.driftwood.resource.request_json(filename))  # This should only be called from here.
+            self.pathfinder.invalidate()
+            self.pathfinder.prepare()
             self.__prepare_frame()
             self.__build_frame()
+            self.changed = False  # The frame already shows the entities spawned with the area.
             self.driftwood.log.info("Area", "loaded", filename)
             return True
 
@@ -116,6 +130,10 @@ class AreaManager:
                 if not tile.tileset and not tile.gid:
                     continue
 
+                # The tileset's image hasn't finished loading yet.
+                if not tile.tileset.texture:
+                    continue
+
                 # Get the source and destination rectangles needed by SDL_RenderCopy.
                 srcrect.x, srcrect.y, srcrect.w, srcrect.h = tile.srcrect()
                 dstrect.x, dstrect.y, dstrect.w, dstrect.h = tile.dstrect
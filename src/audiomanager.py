@@ -0,0 +1,142 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## audiomanager.py               ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+from sdl2 import SDL_INIT_AUDIO, SDL_InitSubSystem
+from sdl2.sdlmixer import *
+
+
+class AudioManager:
+    """The Audio Manager
+
+    This class opens the audio device and plays sound effects and music from the path vfs. Sound effects are decoded
+    and cached by ResourceManager, and music is streamed from its pathname as it plays.
+
+    Attributes:
+        driftwood: Base class instance.
+        enabled: Whether the audio device is open.
+    """
+
+    def __init__(self, driftwood):
+        """AudioManager class initializer.
+
+        Args:
+            driftwood: Base class instance.
+        """
+        self.driftwood = driftwood
+
+        self.enabled = False
+
+        # The currently playing filetype.MusicFile, kept alive while SDL_mixer streams from it.
+        self.__music = None
+
+        # We need to save SDL_mixer's destructors because their continued existence is undefined during shutdown.
+        self.__mix_closeaudio = Mix_CloseAudio
+
+        if self.driftwood.config["audio"]["enabled"]:
+            self.__prepare()
+
+    def __prepare(self):
+        """Open the audio device with the configured settings.
+        """
+        if SDL_InitSubSystem(SDL_INIT_AUDIO) < 0:
+            self.driftwood.log.msg("ERROR", "Audio", "cannot initialize audio")
+            return
+
+        Mix_Init(MIX_INIT_OGG)
+
+        if Mix_OpenAudio(self.driftwood.config["audio"]["frequency"], MIX_DEFAULT_FORMAT, 2,
+                         self.driftwood.config["audio"]["chunksize"]) < 0:
+            self.driftwood.log.msg("ERROR", "Audio", "cannot open audio device")
+            return
+
+        self.enabled = True
+
+    def play_sfx(self, filename, volume=128, loops=0):
+        """Play a sound effect.
+
+        Args:
+            filename: Filename of the sound effect.
+            volume: (optional) Volume from 0 to 128.
+            loops: (optional) Number of extra times to play the sound effect, or -1 to loop forever.
+
+        Returns: The mixer channel playing the sound effect, or None if failed.
+        """
+        if not self.enabled:
+            return None
+
+        sound = self.driftwood.resource.request_audio(filename)
+        if not sound:
+            return None
+
+        channel = Mix_PlayChannel(-1, sound.chunk, loops)
+        if channel < 0:
+            self.driftwood.log.info("Audio", "no free channel", filename)
+            return None
+
+        Mix_Volume(channel, volume)
+        self.driftwood.log.info("Audio", "playing sound effect", filename)
+        return channel
+
+    def play_music(self, filename, volume=128, loops=-1):
+        """Play music, replacing any music already playing.
+
+        Args:
+            filename: Filename of the music file.
+            volume: (optional) Volume from 0 to 128.
+            loops: (optional) Number of times to play the music, or -1 to loop forever.
+
+        Returns: True if succeeded, False if failed.
+        """
+        if not self.enabled:
+            return False
+
+        music = self.driftwood.resource.request_audio(filename, stream=True)
+        if not music:
+            return False
+
+        self.stop_music()
+
+        if Mix_PlayMusic(music.music, loops) < 0:
+            self.driftwood.log.msg("ERROR", "Audio", "cannot play music", filename)
+            return False
+
+        Mix_VolumeMusic(volume)
+        self.__music = music
+        self.driftwood.log.info("Audio", "playing music", filename)
+        return True
+
+    def stop_music(self):
+        """Stop the music, if any is playing.
+        """
+        if self.__music:
+            Mix_HaltMusic()
+            self.__music = None
+
+    def __del__(self):
+        if self.enabled:
+            self.__music = None
+            self.__mix_closeaudio()
@@ -24,6 +24,9 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import json
+import sys
+
 from sdl2 import SDL_GetTicks
 
 
@@ -33,6 +36,9 @@ class CacheManager:
     This class handles the cache of recently used files. If enabled, files are stored in memory for a specified period
     of time and up to the specified maximum cache size.
 
+    Statistics are kept per key namespace. A key of the form "NS:name" belongs to namespace "NS" (DatabaseManager uses
+    "DB"), and any other key belongs to the "Resource" namespace.
+
     Attributes:
         driftwood: Base class instance.
     """
@@ -48,6 +54,17 @@ class CacheManager:
         self.__cache = {}
         self.__ticks = 0
 
+        # Dictionary of statistics dictionaries mapped by key namespace.
+        #
+        # Dict Keys:
+        #     hits: Number of downloads which found the file.
+        #     misses: Number of downloads which did not find the file.
+        #     evictions: Number of files purged before they expired.
+        #     expirations: Number of files purged by garbage collection.
+        #     entries: Number of files currently held.
+        #     bytes: Approximate size in bytes of the files currently held.
+        self.__stats = {}
+
         # Check if the cache should be enabled.
         if self.driftwood.config["cache"]["enabled"] and self.driftwood.config["cache"]["ttl"] > 0:
             self.__enabled = True
@@ -82,9 +99,17 @@ class CacheManager:
         if not self.__enabled:
             return
 
+        if filename in self.__cache:
+            self.__forget(filename)
+
         self.__cache[filename] = {}
         self.__cache[filename]["timestamp"] = SDL_GetTicks()
         self.__cache[filename]["contents"] = contents
+        self.__cache[filename]["size"] = self.__sizeof(contents)
+
+        stats = self.__namespace_stats(filename)
+        stats["entries"] += 1
+        stats["bytes"] += self.__cache[filename]["size"]
 
         self.driftwood.log.info("Cache", "uploaded", filename)
 
@@ -93,12 +118,17 @@ class CacheManager:
 
         Args:
             filename: Filename of the file to download.
+
+        Returns: Contents of the file if cached, None otherwise.
         """
         if filename in self.__cache:
             self.__cache[filename]["timestamp"] = SDL_GetTicks()
+            self.__namespace_stats(filename)["hits"] += 1
             self.driftwood.log.info("Cache", "downloaded", filename)
             return self.__cache[filename]["contents"]
 
+        self.__namespace_stats(filename)["misses"] += 1
+
     def purge(self, filename):
         """Purge a file from the cache.
 
@@ -106,15 +136,54 @@ class CacheManager:
             filename: Filename of the file to purge.
         """
         if filename in self.__cache:
-            del self.__cache[filename]
+            self.__forget(filename)
+            self.__namespace_stats(filename)["evictions"] += 1
             self.driftwood.log.info("Cache", "purged", filename)
 
     def flush(self):
         """Empty the cache.
         """
-        self.__cache = {}
+        for filename in list(self.__cache):
+            self.__forget(filename)
+            self.__namespace_stats(filename)["evictions"] += 1
+
         self.driftwood.log.info("Cache", "flushed")
 
+    def stats(self, namespace=None):
+        """Retrieve cache statistics.
+
+        Args:
+            namespace: (optional) Only return the statistics of this key namespace.
+
+        Returns: Dictionary of statistics if namespace is set, otherwise a dictionary of statistics dictionaries mapped
+            by namespace.
+        """
+        if namespace is not None:
+            if namespace in self.__stats:
+                return dict(self.__stats[namespace])
+            return self.__new_stats()
+
+        return {ns: dict(self.__stats[ns]) for ns in self.__stats}
+
+    def write_stats(self, filename):
+        """Write the cache statistics to a JSON metrics file.
+
+        Args:
+            filename: Filename of the metrics file to write.
+
+        Returns: True if succeeded, False if failed.
+        """
+        try:
+            with open(filename, 'w') as f:
+                json.dump({"ticks": SDL_GetTicks(), "stats": self.stats()}, f, indent=4, sort_keys=True)
+
+        except:
+            self.driftwood.log.msg("ERROR", "Cache", "could not write metrics file", filename)
+            return False
+
+        self.driftwood.log.info("Cache", "wrote metrics", filename)
+        return True
+
     def clean(self, millis_past):
         """Perform garbage collection on expired files.
         """
@@ -129,6 +198,48 @@ class CacheManager:
         # Clean expired files
         if expired:
             for filename in expired:
-                self.purge(filename)
+                self.__forget(filename)
+                self.__namespace_stats(filename)["expirations"] += 1
 
             self.driftwood.log.info("Cache", "cleaned", str(len(expired))+" file(s)")
+
+        # Write out the metrics file if one is configured.
+        if "metrics" in self.driftwood.config["cache"] and self.driftwood.config["cache"]["metrics"]:
+            self.write_stats(self.driftwood.config["cache"]["metrics"])
+
+    def __forget(self, filename):
+        """Remove a file from the cache and subtract it from the statistics.
+        """
+        stats = self.__namespace_stats(filename)
+        stats["entries"] -= 1
+        stats["bytes"] -= self.__cache[filename]["size"]
+        del self.__cache[filename]
+
+    def __namespace_stats(self, filename):
+        """Return the statistics dictionary for a filename's namespace, creating it if necessary.
+        """
+        namespace = "Resource"
+        if ':' in filename:
+            namespace = filename.split(':', 1)[0]
+
+        if namespace not in self.__stats:
+            self.__stats[namespace] = self.__new_stats()
+
+        return self.__stats[namespace]
+
+    def __new_stats(self):
+        return {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "entries": 0, "bytes": 0}
+
+    def __sizeof(self, contents):
+        """Approximate the size in bytes of cached contents.
+        """
+        if isinstance(contents, (bytes, bytearray)):
+            return len(contents)
+
+        elif isinstance(contents, str):
+            return len(contents.encode())
+
+        elif isinstance(contents, memoryview):
+            return contents.nbytes
+
+        return sys.getsizeof(contents)
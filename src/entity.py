@@ -24,9 +24,59 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import collections
+import copy
+import types
+
+import pathfinder
 import spritesheet
 
 
+class EntityTemplate(collections.namedtuple("EntityTemplate", ["filename", "mode", "collision", "width", "height",
+                                                                 "speed", "members", "afps", "image", "properties",
+                                                                 "hooks"])):
+    """This immutable class holds a parsed entity descriptor, shared by all entities inserted from it.
+
+    Attributes:
+        filename: Filename of the JSON entity descriptor.
+        mode: The movement mode of the entities.
+        collision: Whether collision should be checked for.
+        width: The width in pixels of the entities.
+        height: The height in pixels of the entities.
+        speed: The movement speed of the entities in pixels per second.
+        members: A tuple of sequence positions of member graphics in the spritesheet.
+        afps: Animation frames-per-second.
+        image: Filename of the sprite sheet image.
+        properties: A read-only mapping of the custom properties of the entities. Each entity gets its own deep copy.
+        hooks: A read-only mapping of ScriptHook instances for the entities' script events, mapped by event name.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, entitymanager, filename, data):
+        """Build a template from the JSON contents of an entity descriptor.
+
+        Args:
+            entitymanager: EntityManager instance, to resolve the script hooks with.
+            filename: Filename of the JSON entity descriptor.
+            data: JSON contents of the entity descriptor.
+
+        Returns: EntityTemplate instance.
+        """
+        hooks = {}
+        if "on_insert" in data:
+            hooks["on_insert"] = entitymanager.driftwood.script.event(data["on_insert"])
+
+        # Copy the properties so the template does not share nested values with the cached descriptor.
+        properties = {}
+        if "properties" in data:
+            properties = copy.deepcopy(data["properties"])
+
+        return cls(filename, data["mode"], data["collision"], data["width"], data["height"], data["speed"],
+                   tuple(data["members"]), data["afps"], data["image"], types.MappingProxyType(properties),
+                   types.MappingProxyType(hooks))
+
+
 class Entity:
     """This parent class represents an Entity. It is subclassed by either TileModeEntity or PixelModeEntity.
 
@@ -34,6 +84,7 @@ class Entity:
         manager: Parent EntityManager instance.
 
         filename: Filename of the JSON entity descriptor.
+        template: EntityTemplate instance of the entity descriptor.
         eid: The Entity ID number.
         mode: The movement mode of the entity.
         acceleration: Direction of next movement.
@@ -51,6 +102,7 @@ class Entity:
         afps: Animation frames-per-second.
         gpos: A four-member list containing an x,y,w,h source rectangle for the entity's graphic.
         properties: Any custom properties of the entity.
+        hooks: A dictionary of ScriptHook instances for the entity's script events, mapped by event name.
     """
 
     def __init__(self, entitymanager):
@@ -62,6 +114,7 @@ class Entity:
         self.manager = entitymanager
 
         self.filename = ""
+        self.template = None
         self.eid = 0
 
         if isinstance(self, TileModeEntity):
@@ -84,14 +137,14 @@ class Entity:
         self.members = []
         self.afps = 0
         self.properties = {}
+        self.hooks = {}
 
         self.walking = None
+        self._partial_xy = [0, 0]
 
         self.__cur_member = 0
         self._next_area = None
 
-        self.__entity = {}
-
     def srcrect(self):
         """Return an (x, y, w, h) srcrect for the current graphic frame of the entity.
         """
@@ -100,37 +153,57 @@ class Entity:
                 ((current_member * self.width) // self.spritesheet.imagewidth) * self.height,
                 self.width, self.height)
 
-    def _read(self, filename, eid):
-        """Read the entity descriptor.
+    def _read(self, template, eid):
+        """Set up the entity from its descriptor's template. This also wakes up an entity taken from the pool.
         """
-        self.filename = filename
+        self.filename = template.filename
+        self.template = template
         self.eid = eid
 
-        self.__entity = self.manager.driftwood.resource.request_json(filename)
+        self.next_velocity = (0, 0)
+        self.velocity = (0, 0)
+        self._partial_xy = [0, 0]
+        self._next_area = None
+        self.__cur_member = 0
 
-        self.collision = self.__entity["collision"]
-        self.width = self.__entity["width"]
-        self.height = self.__entity["height"]
-        self.speed = self.__entity["speed"]
-        self.members = self.__entity["members"]
-        self.afps = self.__entity["afps"]
+        self.collision = template.collision
+        self.width = template.width
+        self.height = template.height
+        self.speed = template.speed
+        self.members = template.members
+        self.afps = template.afps
 
         # Schedule animation.
         if self.afps:
-            self.manager.driftwood.tick.register(self.__next_member, delay=(1000//self.afps))
+            self.manager.animation.add(self)
 
-        if "properties" in self.__entity:
-            self.properties = self.__entity["properties"]
+        # Nested values would be shared between the entities by a shallow copy.
+        self.properties = copy.deepcopy(dict(template.properties))
+        self.hooks = dict(template.hooks)
 
-        ss = self.manager.spritesheet(self.__entity["image"])
+        ss = self.manager.spritesheet(template.image)
 
         if ss:
             self.spritesheet = ss
 
         else:
-            self.manager.spritesheets.append(spritesheet.Spritesheet(self.manager, self.__entity["image"]))
+            self.manager.spritesheets.append(spritesheet.Spritesheet(self.manager, template.image))
             self.spritesheet = self.manager.spritesheets[-1]
 
+    def _retire(self):
+        """Stop the entity after it has been killed.
+
+        The entity leaves the AnimationClock and stops walking, so a pooled entity costs nothing until it is read again.
+        """
+        self.tile = None
+
+        self.manager.animation.remove(self)
+
+    def _bounds(self):
+        """Return the (x, y, w, h) rectangle the entity occupies for collision purposes.
+        """
+        return self.x, self.y, self.width, self.height
+
     def _collide(self, dsttile):
         """Report a collision.
         """
@@ -145,15 +218,37 @@ class Entity:
             (y / self.manager.driftwood.area.tilemap.tileheight) + py
         )
 
-    def __next_member(self, millis):
-        self.__cur_member = (self.__cur_member + 1) % len(self.members)
-        self.manager.driftwood.area.changed = True
+    def _animate(self, frames):
+        """Advance the entity's animation by a number of frames.
+
+        This method is marked private even though it's called from AnimationClock, because it should not be called
+        outside the engine code.
+        """
+        self.__cur_member = (self.__cur_member + frames) % len(self.members)
 
 
 # TODO: When PixelModeEntity is done, move common logic into functions in the superclass.
 class TileModeEntity(Entity):
     """This Entity subclass represents an Entity configured for movement in by-tile mode.
     """
+    def __init__(self, entitymanager):
+        super().__init__(entitymanager)
+
+        # Whether we are registered to walk each tick.
+        self.__walk_registered = False
+
+    def _retire(self):
+        """Stop the entity after it has been killed.
+        """
+        super()._retire()
+        self.__walk_unregister()
+
+    def _bounds(self):
+        """Return the (x, y, w, h) rectangle the entity occupies for collision purposes, which is one tile.
+        """
+        tilemap = self.manager.driftwood.area.tilemap
+        return self.x, self.y, tilemap.tilewidth, tilemap.tileheight
+
     def teleport(self, layer, x, y):
         """Teleport the entity to a new tile position.
 
@@ -185,6 +280,9 @@ class TileModeEntity(Entity):
 
         # Set the new tile.
         self.tile = self._tile_at(self.layer, self.x, self.y)
+        self.manager._moved(self)
+        if self.manager.walkbatch:
+            self.manager.walkbatch.sync(self, partial=False)
 
         # Call the on_tile event if set.
         self.__call_on_tile()
@@ -199,15 +297,66 @@ class TileModeEntity(Entity):
         """Tell the entity that it wants to move in direction x, y.
         """
         if self.next_velocity == (0, 0):
-            self.manager.driftwood.tick.register(self.__process_walk)
+            self.__walk_register()
         self.next_velocity = (x, y)
         if self.velocity == (0, 0) and self.next_velocity == (0, 0):
+            self.__walk_unregister()
+
+    def __walk_register(self):
+        """Start moving each tick, on our own or as part of the manager's WalkBatch.
+        """
+        if self.__walk_registered:
+            return
+
+        if self.manager.walkbatch:
+            self.manager.walkbatch.add(self)
+        else:
+            self.manager.driftwood.tick.register(self.__process_walk)
+        self.__walk_registered = True
+
+    def __walk_unregister(self):
+        if not self.__walk_registered:
+            return
+
+        if self.manager.walkbatch:
+            self.manager.walkbatch.remove(self)
+        else:
             self.manager.driftwood.tick.unregister(self.__process_walk)
+        self.__walk_registered = False
 
     def __process_walk(self, millis_past):
         """Move through tiles in a process that takes time.
         """
         # Accelerate
+        if not self._start_walk():
+            return
+
+        # Inch along
+        self.manager.driftwood.area.changed = True
+
+        tilemap = self.manager.driftwood.area.tilemap
+        tilewidth = tilemap.tilewidth
+        tileheight = tilemap.tileheight
+
+        x, y = self.velocity
+        tile_pos = self.tile.pos
+
+        self._partial_xy[0] += x * self.speed * millis_past / 1000
+        self._partial_xy[1] += y * self.speed * millis_past / 1000
+        self.x = int(tile_pos[0] * tilewidth + self._partial_xy[0])
+        self.y = int(tile_pos[1] * tileheight + self._partial_xy[1])
+        self.manager._moved(self)
+
+        self._arrive()
+
+    def _start_walk(self):
+        """Start walking toward next_velocity if we are standing still.
+
+        This method is marked private even though it's called from WalkBatch, because it should not be called outside
+        the engine code.
+
+        Returns: False if we are standing still and blocked, True otherwise.
+        """
         if self.velocity == (0, 0):
             if self.next_velocity == (0, 0):
                 self.manager.driftwood.log.info("DEBUG", "Entity", "__process_walk: velocity and next_velocity (0, 0)")
@@ -218,23 +367,21 @@ class TileModeEntity(Entity):
             else:
                 # The entity is trying to move in a direction but is being blocked.  We will keep trying to move each
                 # frame until we get new orders.
-                return
+                return False
 
-        # Inch along
-        self.manager.driftwood.area.changed = True
+        return True
+
+    def _arrive(self):
+        """Arrive at the next tile if our partial movement has reached it, and carry on or stop.
 
+        This method is marked private even though it's called from WalkBatch, because it should not be called outside
+        the engine code.
+        """
         tilemap = self.manager.driftwood.area.tilemap
         tilewidth = tilemap.tilewidth
         tileheight = tilemap.tileheight
-
-        x, y = self.velocity
         tile_pos = self.tile.pos
 
-        self._partial_xy[0] += x * self.speed * millis_past / 1000
-        self._partial_xy[1] += y * self.speed * millis_past / 1000
-        self.x = int(tile_pos[0] * tilewidth + self._partial_xy[0])
-        self.y = int(tile_pos[1] * tileheight + self._partial_xy[1])
-
         # Have we arrived at our next tile?
         while True:
             x, y = self.velocity
@@ -303,17 +450,10 @@ class TileModeEntity(Entity):
             # Don't walk on nowalk tiles or off the edge of the map unless there's a lazy exit.
             if self.tile:
                 if dsttile:
-                    if dsttile.nowalk or dsttile.nowalk == "":
-                        # Is the tile a player or npc specific nowalk?
-                        if (dsttile.nowalk == "player" and self.manager.player.eid == self.eid
-                                or dsttile.nowalk == "npc" and self.manager.player.eid != self.eid):
-                            self._collide(dsttile)
-                            return False
-
-                        # Any other values are an unconditional nowalk.
-                        elif not dsttile.nowalk in ["player", "npc"]:
-                            self._collide(dsttile)
-                            return False
+                    # Is the tile a nowalk, possibly specific to the player or npcs?
+                    if pathfinder.blocks(dsttile.nowalk, self.manager.player is self):
+                        self._collide(dsttile)
+                        return False
 
                 else:
 
@@ -338,22 +478,21 @@ class TileModeEntity(Entity):
             if dsttile and not self._next_area and "exit" in dsttile.exits:
                 self._next_area = dsttile.exits["exit"].split(',')
 
-            # Entity collision detection.
-            for ent in self.manager.entities:
+            # Entity collision detection. Only entities near the destination tile can be on it.
+            tilemap = self.manager.driftwood.area.tilemap
+            tilewidth = tilemap.tilewidth
+            tileheight = tilemap.tileheight
+            dstx = (self.tile.pos[0] + x) * tilewidth
+            dsty = (self.tile.pos[1] + y) * tileheight
+
+            for ent in self.manager._nearby(self.layer, dstx, dsty, tilewidth, tileheight):
                 # This is us.
                 if ent.eid == self.eid:
                     continue
 
-                # Collision detection.
-                tilemap = self.manager.driftwood.area.tilemap
-                tilewidth = tilemap.tilewidth
-                tileheight = tilemap.tileheight
-                if (
-                    self.x + tilewidth < ent.x
-                    or self.x > ent.x + tilewidth
-                    or self.y + tileheight < ent.y
-                    or self.y > ent.y + tileheight
-                ):
+                # Does the entity overlap the destination tile?
+                entx, enty, entw, enth = ent._bounds()
+                if entx < dstx + tilewidth and dstx < entx + entw and enty < dsty + tileheight and dsty < enty + enth:
                     self.manager.collision(self, ent)
                     return False
 
@@ -374,15 +513,16 @@ class TileModeEntity(Entity):
             if self.tile:
                 self.x = self.tile.pos[0] * tilewidth
                 self.y = self.tile.pos[1] * tileheight
+                self.manager._moved(self)
 
-            self.manager.driftwood.tick.unregister(self.__process_walk)
+            self.__walk_unregister()
 
     def _do_exit(self):
         """Perform an exit to another area.
         """
         # Call the on_exit event if set.
-        if "on_exit" in self.manager.driftwood.area.tilemap.properties:
-            self.manager.driftwood.script.call(*self.manager.driftwood.area.tilemap.properties["on_exit"].split(':'))
+        if "on_exit" in self.manager.driftwood.area.tilemap.hooks:
+            self.manager.driftwood.area.tilemap.hooks["on_exit"]()
 
         # Enter the next area.
         if self.manager.driftwood.area.focus(self._next_area[0]):
@@ -390,6 +530,7 @@ class TileModeEntity(Entity):
             self.x = int(self._next_area[2]) * self.manager.driftwood.area.tilemap.tilewidth
             self.y = int(self._next_area[3]) * self.manager.driftwood.area.tilemap.tileheight
             self.tile = self._tile_at(self.layer, self.x, self.y)
+            self.manager._moved(self)
 
         self._next_area = None
 
@@ -398,14 +539,13 @@ class TileModeEntity(Entity):
 
     def __call_on_tile(self):
         # Call the on_tile event if set.
-        if "on_tile" in self.tile.properties:
-            args = self.tile.properties["on_tile"].split(':')
-            self.manager.driftwood.script.call(*args)
+        if "on_tile" in self.tile.hooks:
+            self.tile.hooks["on_tile"]()
 
     def __call_on_layer(self):
-        if "on_layer" in self.manager.driftwood.area.tilemap.layers[self.layer].properties:
-            args = self.manager.driftwood.area.tilemap.layers[self.layer].properties["on_layer"].split(':')
-            self.manager.driftwood.script.call(*args)
+        hooks = self.manager.driftwood.area.tilemap.layers[self.layer].hooks
+        if "on_layer" in hooks:
+            hooks["on_layer"]()
 
     def __do_layermod(self):
         # Layermod macro, change the layer.
@@ -457,52 +597,123 @@ class PixelModeEntity(Entity):
         if y:
             self.y = y
 
+        self.manager._moved(self)
+
         self.manager.driftwood.area.changed = True
 
     def walk(self, x, y):
-        """Move the entity by one pixel to a new position relative to its current position.
+        """Move the entity by a number of pixels relative to its current position.
+
+        The move is swept against the layer's nowalk tiles and the entities in the way, so the entity stops against
+        the first thing it would run into, however far it moves. The x move is made before the y move.
 
         Args:
-            x: -1 for left, 1 for right, 0 for no x movement.
-            y: -1 for up, 1 for down, 0 for no y movement.
+            x: Pixels to move right, or left if negative.
+            y: Pixels to move down, or up if negative.
 
-        Returns: True if succeeded, false if failed (due to collision).
+        Returns: True if succeeded, false if the entity was stopped short (due to collision).
         """
-        if not x or not x in [-1, 0, 1]:
-            x = 0
+        x = int(x or 0)
+        y = int(y or 0)
+        complete = True
 
-        if not y or not y in [-1, 0, 1]:
-            y = 0
+        if x:
+            moved = self.__sweep(0, x) if self.collision else x
+            self.x += moved
+            complete = complete and moved == x
 
-        # Perform collision detection.
-        if self.collision:
-            # TODO: Pixel mode tile collisions.
+        if y:
+            moved = self.__sweep(1, y) if self.collision else y
+            self.y += moved
+            complete = complete and moved == y
 
-            # Entity collision detection.
-            for ent in self.manager.entities:
-                # This is us.
-                if ent.eid == self.eid:
-                    continue
+        self.manager._moved(self)
 
-                # Collision detection, proof by contradiction.
-                if not (
-                    self.x + x > ent.x + ent.width
+        self.manager.driftwood.area.changed = True
 
-                    and self.x + self.width + x < ent.x
+        return complete
 
-                    and self.y + y > ent.y + ent.height
+    def __sweep(self, axis, delta):
+        """Find how far the entity can move along one axis before it runs into a nowalk tile or another entity, and
+        report what it ran into.
 
-                    and self.y + self.height + y < ent.y
-                ):
-                    self.manager.collision(self, ent)
-                    return False
+        Args:
+            axis: 0 to move along x, 1 to move along y.
+            delta: Pixels to move, negative toward the top or left.
+
+        Returns: Pixels the entity can move, between 0 and delta.
+        """
+        tilemap = self.manager.driftwood.area.tilemap
+        tilesize = (tilemap.tilewidth, tilemap.tileheight)
+        pos = (self.x, self.y)
+        size = (self.width, self.height)
+        cross = 1 - axis
+
+        grid = self.manager.driftwood.area.pathfinder.grid(self.layer, self.manager.player is self)
+
+        def blocked(a, b):
+            tx, ty = (a, b) if axis == 0 else (b, a)
+            return not (0 <= tx < tilemap.width and 0 <= ty < tilemap.height) or grid[ty * tilemap.width + tx]
+
+        # The rows (or columns) of tiles the entity covers across its movement.
+        across = range(pos[cross] // tilesize[cross], (pos[cross] + size[cross] - 1) // tilesize[cross] + 1)
+
+        # Sweep the leading edge through the columns (or rows) of tiles it enters.
+        allowed = delta
+        hit = None
+        if delta > 0:
+            edge = pos[axis] + size[axis]
+            entered = range((edge - 1) // tilesize[axis] + 1, (edge + delta - 1) // tilesize[axis] + 1)
+        else:
+            edge = pos[axis]
+            entered = range(edge // tilesize[axis] - 1, (edge + delta) // tilesize[axis] - 1, -1)
+
+        for a in entered:
+            for b in across:
+                if blocked(a, b):
+                    hit = (a, b) if axis == 0 else (b, a)
+                    break
+            if hit:
+                allowed = a * tilesize[axis] - edge if delta > 0 else (a + 1) * tilesize[axis] - edge
+                break
 
-        self.x += x
-        self.y += y
+        # Entity collision detection, among the entities near the swept area.
+        swept = list(pos) + list(size)
+        if allowed > 0:
+            swept[2 + axis] += allowed
+        else:
+            swept[axis] += allowed
+            swept[2 + axis] -= allowed
+
+        blocker = None
+        for ent in self.manager._nearby(self.layer, *swept):
+            # This is us.
+            if ent.eid == self.eid:
+                continue
+
+            entbounds = ent._bounds()
+            entpos, entsize = entbounds[:2], entbounds[2:]
+
+            # Is it beside our path?
+            if not (entpos[cross] < pos[cross] + size[cross] and pos[cross] < entpos[cross] + entsize[cross]):
+                continue
+
+            # How far away is it? Entities we already overlap don't stop us.
+            if delta > 0:
+                gap = entpos[axis] - (pos[axis] + size[axis])
+                if 0 <= gap < allowed:
+                    allowed, blocker = gap, ent
+            else:
+                gap = entpos[axis] + entsize[axis] - pos[axis]
+                if allowed < gap <= 0:
+                    allowed, blocker = gap, ent
 
-        self.manager.driftwood.area.changed = True
+        if blocker:
+            self.manager.collision(self, blocker)
+        elif hit:
+            self._collide(tilemap.layers[self.layer].tile(*hit))
 
-        return True
+        return allowed
 
 
 # TODO: Implement turn mode.
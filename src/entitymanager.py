@@ -24,7 +24,9 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import animationclock
 import entity
+import walkbatch
 from inputmanager import InputManager
 
 
@@ -33,13 +35,24 @@ class EntityManager:
 
     This class manages entities in the current area, as well as the persistent player entity.
 
+    Up to config["entity"]["pool"] killed entities per descriptor are kept and reset for the next insertion from that
+    descriptor, instead of being thrown away and allocated again. Only the objects are recycled: a killed entity gives up
+    its animation and walking either way, and takes them up again as needed once reused. Pooling is off when this is 0,
+    the default.
+
+    Entities are kept in a uniform grid of config["entity"]["cell"] pixel cells per layer, so that collision checks
+    only need to look at the entities near a position. Entities report when they move or change layers.
+
     Attributes:
         driftwood: Base class instance.
 
         player: The player entity.
         collider: The collision callback. The callback must take as arguments the two entities that collided.
+        animation: AnimationClock instance advancing the animation frames of all entities.
+        walkbatch: WalkBatch instance moving all walking tile mode entities together, or None if they move on their
+            own.
 
-        entities: The list of Entity class instances for each entity.
+        entities: Tuple of the Entity class instances for each entity, in order of insertion.
         spritesheets: The list of Spritesheet class instances for each sprite sheet.
     """
     def __init__(self, driftwood):
@@ -53,12 +66,65 @@ class EntityManager:
         self.player = None
         self.collider = None
 
-        self.entities = []
-
         self.spritesheets = []
 
         self.__last_eid = -1
 
+        # Spatial hash of sets of entities, mapped by layer and then by (x, y) cell.
+        self.__grid = {}
+
+        # Dictionary of the (layer, first x cell, first y cell, last x cell, last y cell) tuples each entity occupies in
+        # the spatial hash, mapped by eid.
+        self.__places = {}
+
+        # Dictionaries of entities mapped by eid; by layer and then eid; and by descriptor filename and then eid. The first
+        # also keeps the order of insertion for the entities property.
+        self.__eids = {}
+        self.__layers = {}
+        self.__filenames = {}
+
+        # Cache of the tuple returned by the entities property.
+        self.__entities = None
+
+        # Dictionary of EntityTemplate instances mapped by descriptor filename.
+        self.__templates = {}
+
+        # Lists of killed entities kept for reuse, mapped by descriptor filename, and the most to keep per descriptor.
+        self.__pools = {}
+        self.__poolsize = 0
+        if "entity" in self.driftwood.config and "pool" in self.driftwood.config["entity"]:
+            self.__poolsize = self.driftwood.config["entity"]["pool"]
+
+        # Cache of the tuples returned by layer(), mapped by layer.
+        self.__layer_tuples = {}
+
+        self.__cellsize = 64
+        if "entity" in self.driftwood.config and "cell" in self.driftwood.config["entity"]:
+            self.__cellsize = self.driftwood.config["entity"]["cell"]
+
+        # Animate all entities together.
+        self.animation = animationclock.AnimationClock(self)
+        self.driftwood.tick.register(self.animation.tick)
+
+        # Move walking entities together if asked to and NumPy is available.
+        self.walkbatch = None
+        if "entity" in self.driftwood.config and "batch" in self.driftwood.config["entity"] and \
+                self.driftwood.config["entity"]["batch"]:
+            if walkbatch.np:
+                self.walkbatch = walkbatch.WalkBatch(self)
+                self.driftwood.tick.register(self.walkbatch.tick)
+            else:
+                self.driftwood.log.info("Entity", "NumPy is not available, entities will walk on their own")
+
+    @property
+    def entities(self):
+        """Tuple of the Entity class instances for each entity, in order of insertion.
+        """
+        # Rebuild the tuple only after entities have been inserted or killed.
+        if self.__entities is None:
+            self.__entities = tuple(self.__eids.values())
+        return self.__entities
+
     def insert(self, filename, layer, x, y):
         """Insert an entity at a position in the area.
 
@@ -70,49 +136,132 @@ class EntityManager:
 
         Returns: New entity if succeeded, None if failed.
         """
-        data = self.driftwood.resource.request_json(filename)
+        template = self.template(filename)
+        if not template:
+            return None
 
-        if data["mode"] == "tile":
-            self.entities.append(entity.TileModeEntity(self))
+        ent = self.__spawn(template, layer, x, y)
+        if not ent:
+            return None
 
-        elif data["mode"] == "pixel":
-            self.entities.append(entity.PixelModeEntity(self))
+        self.driftwood.area.changed = True
 
-        else:
+        self.driftwood.log.info("Entity", "inserted", "{0} entity on layer {1} at position {2}, {3}".format(filename,
+                                                                                                            layer,
+                                                                                                            x, y))
+
+        if "on_insert" in ent.hooks:
+            ent.hooks["on_insert"](ent)
+
+        return ent
+
+    def insert_many(self, filename, positions):
+        """Insert many entities from the same descriptor at once.
+
+        The on_insert events of the new entities are called after all of them have been inserted.
+
+        Args:
+            filename: Filename of the JSON entity descriptor.
+            positions: List of (layer, x, y) tuples to insert entities at.
+
+        Returns: List of the new entities, leaving out any that could not be inserted.
+        """
+        template = self.template(filename)
+        if not template:
+            return []
+
+        ents = []
+        for layer, x, y in positions:
+            ent = self.__spawn(template, layer, x, y)
+            if ent:
+                ents.append(ent)
+
+        if ents:
+            self.driftwood.area.changed = True
+            self.driftwood.log.info("Entity", "inserted", "{0} {1} entities".format(len(ents), filename))
+
+            if "on_insert" in template.hooks:
+                for ent in ents:
+                    ent.hooks["on_insert"](ent)
+
+        return ents
+
+    def template(self, filename):
+        """Retrieve the template of an entity descriptor, reading the descriptor if it is not already known.
+
+        Args:
+            filename: Filename of the JSON entity descriptor.
+
+        Returns: EntityTemplate instance if succeeded, None if failed.
+        """
+        if filename in self.__templates:
+            return self.__templates[filename]
+
+        data = self.driftwood.resource.request_json(filename)
+        if not data or "mode" not in data:
+            self.driftwood.log.msg("ERROR", "Entity", "could not read descriptor", filename)
+            return None
+
+        if data["mode"] not in ["tile", "pixel"]:
             self.driftwood.log.msg("ERROR", "Entity", "invalid mode", "\"{0}\"".format(data["mode"]))
             return None
 
-        self.__last_eid += 1
-        eid = self.__last_eid
+        self.__templates[filename] = entity.EntityTemplate.parse(self, filename, data)
+        return self.__templates[filename]
 
-        self.entities[eid]._read(filename, eid)
+    def invalidate(self, filename):
+        """Forget the template of an entity descriptor, so it is read again for the next insertion.
 
-        self.entities[eid].x = x
-        self.entities[eid].y = y
-        self.entities[eid].layer = layer
+        Entities already inserted from the descriptor are not changed, but any in its pool are dropped.
 
-        # Are we on a tile?
-        if (x % self.driftwood.area.tilemap.tilewidth == 0) and (y % self.driftwood.area.tilemap.tileheight == 0):
-            self.entities[eid].tile = self.driftwood.area.tilemap.layers[layer].tile(
-                x / self.driftwood.area.tilemap.tilewidth,
-                y / self.driftwood.area.tilemap.tileheight
-            )
+        Args:
+            filename: Filename of the JSON entity descriptor.
+        """
+        if filename in self.__templates:
+            del self.__templates[filename]
 
-        else:
+        if filename in self.__pools:
+            del self.__pools[filename]
+
+    def __spawn(self, template, layer, x, y):
+        """Create an entity from a template and add it to the area.
+        """
+        # Are we on a tile?
+        if (x % self.driftwood.area.tilemap.tilewidth != 0) or (y % self.driftwood.area.tilemap.tileheight != 0):
             self.driftwood.log.msg("ERROR", "Entity", "must start on a tile")
             return None
 
-        self.driftwood.area.changed = True
+        # Reuse a killed entity from the descriptor's pool if there is one.
+        if template.filename in self.__pools and self.__pools[template.filename]:
+            ent = self.__pools[template.filename].pop()
 
-        self.driftwood.log.info("Entity", "inserted", "{0} entity on layer {1} at position {2}, {3}".format(filename,
-                                                                                                            layer,
-                                                                                                            x, y))
+        elif template.mode == "tile":
+            ent = entity.TileModeEntity(self)
 
-        if "on_insert" in data:
-            args = data["on_insert"].split(':')
-            self.driftwood.script.call(args[0], args[1], self.entities[eid])
+        else:
+            ent = entity.PixelModeEntity(self)
 
-        return self.entities[-1]
+        self.__last_eid += 1
+        eid = self.__last_eid
+
+        ent._read(template, eid)
+
+        ent.x = x
+        ent.y = y
+        ent.layer = layer
+        ent.tile = self.driftwood.area.tilemap.layers[layer].tile(
+            x / self.driftwood.area.tilemap.tilewidth,
+            y / self.driftwood.area.tilemap.tileheight
+        )
+
+        self.__eids[eid] = ent
+        self.__entities = None
+        if template.filename not in self.__filenames:
+            self.__filenames[template.filename] = {}
+        self.__filenames[template.filename][eid] = ent
+        self._moved(ent)
+
+        return ent
 
     def entity(self, eid):
         """Retrieve an entity by eid
@@ -122,9 +271,8 @@ class EntityManager:
 
         Returns: Entity class instance.
         """
-        for ent in self.entities:
-            if ent.eid == eid:
-                return ent
+        if eid in self.__eids:
+            return self.__eids[eid]
 
     def layer(self, layer):
         """Retrieve a list of entities on a certain layer.
@@ -132,15 +280,76 @@ class EntityManager:
         Args:
             layer: Layer to find entities on.
 
-        Returns: Tuple of Entity class instances.
+        Returns: Tuple of Entity class instances, in order of insertion.
         """
-        ents = []
+        if layer not in self.__layers:
+            return ()
 
-        for ent in self.entities:
-            if ent.layer == layer:
-                ents.append(ent)
+        # Rebuild the tuple only after the layer's entities have changed.
+        if layer not in self.__layer_tuples:
+            self.__layer_tuples[layer] = tuple(self.__layers[layer].values())
+
+        return self.__layer_tuples[layer]
+
+    def rect(self, layer, x, y, w, h):
+        """Retrieve the entities on a layer which overlap a rectangle.
+
+        Args:
+            layer: Layer to find entities on.
+            x: x-coordinate of the rectangle in pixels.
+            y: y-coordinate of the rectangle in pixels.
+            w: Width of the rectangle in pixels.
+            h: Height of the rectangle in pixels.
+
+        Returns: Tuple of Entity class instances, in order of insertion.
+        """
+        found = []
 
-        return tuple(ents)
+        for ent in self._nearby(layer, x, y, w, h):
+            ex, ey, ew, eh = ent._bounds()
+            if ex < x + w and x < ex + ew and ey < y + h and y < ey + eh:
+                found.append(ent)
+
+        return tuple(sorted(found, key=lambda ent: ent.eid))
+
+    def radius(self, layer, x, y, r):
+        """Retrieve the entities on a layer which overlap a circle.
+
+        Args:
+            layer: Layer to find entities on.
+            x: x-coordinate of the center of the circle in pixels.
+            y: y-coordinate of the center of the circle in pixels.
+            r: Radius of the circle in pixels.
+
+        Returns: Tuple of Entity class instances, in order of insertion.
+        """
+        found = []
+
+        for ent in self.rect(layer, x - r, y - r, r * 2, r * 2):
+            # Find the point of the entity nearest the center.
+            ex, ey, ew, eh = ent._bounds()
+            nx = min(max(x, ex), ex + ew)
+            ny = min(max(y, ey), ey + eh)
+            if (nx - x) ** 2 + (ny - y) ** 2 < r * r:
+                found.append(ent)
+
+        return tuple(found)
+
+    def region(self, layer, x, y, w, h):
+        """Retrieve the entities on a layer which overlap a rectangular region of tiles.
+
+        Args:
+            layer: Layer to find entities on.
+            x: x-coordinate of the region's top left tile.
+            y: y-coordinate of the region's top left tile.
+            w: Width of the region in tiles.
+            h: Height of the region in tiles.
+
+        Returns: Tuple of Entity class instances, in order of insertion.
+        """
+        tilewidth = self.driftwood.area.tilemap.tilewidth
+        tileheight = self.driftwood.area.tilemap.tileheight
+        return self.rect(layer, x * tilewidth, y * tileheight, w * tilewidth, h * tileheight)
 
     def kill(self, eid):
         """Kill an entity by eid.
@@ -148,9 +357,23 @@ class EntityManager:
         Args:
             eid: The Entity ID of the entity to kill.
         """
-        for ent in range(len(self.entities)):
-            if self.entities[ent].eid == eid:
-                del self.entities[ent]
+        if eid not in self.__eids:
+            return
+
+        ent = self.__eids.pop(eid)
+        del self.__filenames[ent.filename][eid]
+        if not self.__filenames[ent.filename]:
+            del self.__filenames[ent.filename]
+        self.__unplace(ent)
+        self.__entities = None
+
+        # Keep the entity for reuse if its descriptor's pool has room.
+        if self.__poolsize and ent.template is self.__templates.get(ent.filename):
+            if ent.filename not in self.__pools:
+                self.__pools[ent.filename] = []
+            if len(self.__pools[ent.filename]) < self.__poolsize:
+                self.__pools[ent.filename].append(ent)
+        ent._retire()
 
         self.driftwood.area.changed = True
 
@@ -160,11 +383,9 @@ class EntityManager:
         Args:
             filename: Filename of the JSON entity descriptor whose insertions should be killed.
         """
-        for ent in range(len(self.entities)):
-            if self.entities[ent].filename == filename:
-                del self.entities[ent]
-
-        self.driftwood.area.changed = True
+        if filename in self.__filenames:
+            for eid in list(self.__filenames[filename]):
+                self.kill(eid)
 
     def spritesheet(self, filename):
         """Retrieve a sprite sheet by its filename.
@@ -188,6 +409,117 @@ class EntityManager:
         if self.collider:
             self.collider(a, b)
 
+    def _moved(self, ent):
+        """Update an entity's place in the spatial hash and the layer index after it has moved or changed layers.
+
+        This method is marked private even though it's called from Entity, because it should not be called outside the
+        engine code.
+
+        Args:
+            ent: The entity which moved.
+        """
+        x, y, w, h = ent._bounds()
+        size = self.__cellsize
+        place = (ent.layer, int(x // size), int(y // size), int((x + w - 1) // size), int((y + h - 1) // size))
+
+        old = None
+        if ent.eid in self.__places:
+            old = self.__places[ent.eid]
+
+            # Still in the same cells.
+            if old == place:
+                return
+            self.__ungrid(ent, old)
+
+        # Move the entity to its new layer's index.
+        if not old or old[0] != place[0]:
+            if old:
+                self.__unindex_layer(ent, old[0])
+            if place[0] not in self.__layers:
+                self.__layers[place[0]] = {}
+            self.__layers[place[0]][ent.eid] = ent
+            self.__layer_tuples.pop(place[0], None)
+
+        if place[0] not in self.__grid:
+            self.__grid[place[0]] = {}
+        cells = self.__grid[place[0]]
+
+        for cx in range(place[1], place[3] + 1):
+            for cy in range(place[2], place[4] + 1):
+                if (cx, cy) not in cells:
+                    cells[cx, cy] = set()
+                cells[cx, cy].add(ent)
+
+        self.__places[ent.eid] = place
+
+    def _nearby(self, layer, x, y, w, h):
+        """Retrieve the entities in the spatial hash cells covering a rectangle, which includes all entities that may
+        overlap it.
+
+        This method is marked private even though it's called from Entity, because it should not be called outside the
+        engine code.
+
+        Args:
+            layer: Layer to look on.
+            x: x-coordinate of the rectangle.
+            y: y-coordinate of the rectangle.
+            w: Width of the rectangle.
+            h: Height of the rectangle.
+
+        Returns: Set of Entity class instances.
+        """
+        if layer not in self.__grid:
+            return set()
+
+        cells = self.__grid[layer]
+        size = self.__cellsize
+        found = set()
+
+        x1, y1 = int(x // size), int(y // size)
+        x2, y2 = int((x + w - 1) // size), int((y + h - 1) // size)
+
+        # For a rectangle covering more cells than are occupied, look through the occupied cells instead.
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(cells):
+            for (cx, cy), cell in cells.items():
+                if x1 <= cx <= x2 and y1 <= cy <= y2:
+                    found |= cell
+            return found
+
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                if (cx, cy) in cells:
+                    found |= cells[cx, cy]
+
+        return found
+
+    def __unplace(self, ent):
+        """Remove an entity from the spatial hash and the layer index.
+        """
+        if ent.eid not in self.__places:
+            return
+
+        place = self.__places.pop(ent.eid)
+        self.__ungrid(ent, place)
+        self.__unindex_layer(ent, place[0])
+
+    def __ungrid(self, ent, place):
+        """Remove an entity from the spatial hash cells of a place.
+        """
+        layer, x1, y1, x2, y2 = place
+        cells = self.__grid[layer]
+
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                cells[cx, cy].discard(ent)
+                if not cells[cx, cy]:
+                    del cells[cx, cy]
+
+    def __unindex_layer(self, ent, layer):
+        """Remove an entity from a layer's index.
+        """
+        del self.__layers[layer][ent.eid]
+        self.__layer_tuples.pop(layer, None)
+
     def setup_player(self, ent):
         """Helper function to setup an entity as a functional player.
 
@@ -24,44 +24,306 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import mmap
+import os
+import struct
+import threading
 from ctypes import byref
+from ctypes import c_char
 from ctypes import c_int
+from ctypes import string_at
 from sdl2 import *
+from sdl2.rwops import rw_from_object
 from sdl2.sdlimage import *
+from sdl2.sdlmixer import *
+
+
+def const_mem(data):
+    """
+    Wrap file contents for SDL_RWFromConstMem, handing memory-mapped buffers over without copying them into bytes.
+
+    @type  data: bytes
+    @param data: File contents from ResourceManager.
+    """
+    if isinstance(data, memoryview):
+        return (c_char * data.nbytes).from_buffer(data)
+    return data
+
+
+class StreamBuffer:
+    """This class streams a file-like source through a small bounded buffer filled by a background thread.
+
+    It presents the read, seek, tell, size and close methods expected by sdl2.rwops.rw_from_object, so SDL can read
+    from it on its own threads while the source is read in chunks ahead of time.
+    """
+
+    def __init__(self, source, size, capacity=65536, chunk=8192):
+        """
+        StreamBuffer class initializer.
+
+        @param source: Seekable, readable binary file-like object.
+        @type  size: int
+        @param size: Size in bytes of the source.
+        @type  capacity: int
+        @param capacity: Maximum number of bytes held in the buffer.
+        @type  chunk: int
+        @param chunk: Number of bytes read from the source at a time.
+        """
+        self.__source = source
+        self.__size = size
+        self.__capacity = max(capacity, chunk)
+        self.__chunk = chunk
+
+        self.__buffer = bytearray()
+        self.__pos = 0  # Position of the reader in the stream.
+        self.__srcpos = 0  # Position of the end of the buffer in the stream.
+        self.__closed = False
+
+        # The source lock serializes source access, the condition guards the buffer. Take them in this order.
+        self.__srclock = threading.Lock()
+        self.__cond = threading.Condition()
+
+        self.__thread = threading.Thread(target=self.__fill, name="StreamBuffer")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def read(self, length):
+        """
+        Read up to length bytes, waiting for the background thread if the buffer is empty.
+        """
+        with self.__cond:
+            while not self.__buffer and self.__srcpos < self.__size and not self.__closed:
+                self.__cond.wait()
+
+            data = bytes(self.__buffer[:length])
+            del self.__buffer[:len(data)]
+            self.__pos += len(data)
+            self.__cond.notify_all()
+
+        return data
+
+    def seek(self, offset, whence=RW_SEEK_SET):
+        """
+        Move the read position, keeping the buffered data if the new position is inside it.
+        """
+        with self.__srclock, self.__cond:
+            if whence == RW_SEEK_CUR:
+                offset += self.__pos
+            elif whence == RW_SEEK_END:
+                offset += self.__size
+
+            if offset < 0 or offset > self.__size:
+                raise ValueError("seek out of range")
+
+            if self.__pos <= offset <= self.__srcpos:
+                del self.__buffer[:offset - self.__pos]
+
+            else:
+                self.__buffer = bytearray()
+                self.__source.seek(offset)
+                self.__srcpos = offset
+
+            self.__pos = offset
+            self.__cond.notify_all()
+
+        return self.__pos
+
+    def tell(self):
+        return self.__pos
+
+    def size(self):
+        return self.__size
+
+    def close(self):
+        """
+        Stop the background thread. The source is closed by its owner.
+        """
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    def __fill(self):
+        """
+        Background thread which keeps the buffer topped up from the source.
+        """
+        while True:
+            with self.__cond:
+                while not self.__closed and self.__full():
+                    self.__cond.wait()
+
+                if self.__closed:
+                    return
+
+            # Seeks take the source lock before the condition, so the position cannot move during the read.
+            with self.__srclock:
+                with self.__cond:
+                    if self.__closed:
+                        return
+                    if self.__full():
+                        continue
+
+                data = self.__source.read(self.__chunk)
+
+                with self.__cond:
+                    if not data:
+                        # The source ended early, treat it as the end of the stream.
+                        self.__size = self.__srcpos
+                    self.__buffer += data
+                    self.__srcpos += len(data)
+                    self.__cond.notify_all()
+
+    def __full(self):
+        """
+        Whether the background thread has nothing to do: the buffer is full or the source is exhausted.
+        """
+        return self.__srcpos >= self.__size or len(self.__buffer) + self.__chunk > self.__capacity
 
 
 class AudioFile:
-    """This class represents and abstracts a single OGG Vorbis audio file.
+    """This class represents and abstracts a single sound effect, decoded entirely into memory with SDL_mixer.
     """
 
     def __init__(self, data):
-        self.__data = data
-        self.__open(self.__data)
+        """
+        AudioFile class initializer.
+
+        @type  data: bytes
+        @param data: Audio data from ResourceManager.
+        """
+        self.chunk = None
+        self.size = 0
+
+        # We need to save SDL_mixer's destructors because their continued existence is undefined during shutdown.
+        self.__mix_freechunk = Mix_FreeChunk
+
+        self.__open(data)
 
     def __open(self, data):
+        if data:
+            mem = const_mem(data)
+            self.chunk = Mix_LoadWAV_RW(SDL_RWFromConstMem(mem, len(mem)), 1)
+            if self.chunk:
+                self.size = self.chunk.contents.alen
+
+    def __del__(self):
+        if self.chunk:
+            self.__mix_freechunk(self.chunk)
+
+
+class MusicFile:
+    """This class represents and abstracts a single music file, such as OGG Vorbis, streamed by SDL_mixer as it plays.
+    """
+
+    def __init__(self, source, size, capacity=65536):
+        """
+        MusicFile class initializer.
+
+        @param source: Seekable, readable binary file-like object for the music file.
+        @type  size: int
+        @param size: Size in bytes of the music file.
+        @type  capacity: int
+        @param capacity: Size in bytes of the stream buffer.
+        """
+        self.music = None
+        self.__source = source
+        self.__stream = StreamBuffer(source, size, capacity)
+
+        # SDL only holds a pointer to this, we must keep it alive as long as the music.
+        self.__rwops = rw_from_object(self.__stream)
+
+        # We need to save SDL_mixer's destructors because their continued existence is undefined during shutdown.
+        self.__mix_freemusic = Mix_FreeMusic
+
+        self.music = Mix_LoadMUS_RW(byref(self.__rwops), 0)
+
+    def __del__(self):
+        if self.music:
+            self.__mix_freemusic(self.music)
+        self.__stream.close()
+        self.__source.close()
+
+
+# Header of a decoded pixel buffer in the on-disk cache: magic, width, height, pitch.
+PIXELCACHE_HEADER = struct.Struct("<4sIII")
+PIXELCACHE_MAGIC = b"DWPX"
+
+
+def decode_image(data):
+    """
+    Decode image data into an SDL_Surface with SDL_Image. This does not touch the renderer, so it may be called from
+    worker threads.
+
+    @type  data: bytes
+    @param data: Image data from ResourceManager.
+    @return: Pointer to the new SDL_Surface, which the caller must free, or a null pointer on failure.
+    """
+    data = const_mem(data)
+    return IMG_Load_RW(SDL_RWFromConstMem(data, len(data)), 1)
+
+
+def save_pixelcache(img, pixelcache):
+    """
+    Convert a decoded surface to the fixed pixel format of the on-disk cache and write its pixels there. This does not
+    touch the renderer, so it may be called from worker threads.
+
+    @param img: SDL_Surface to store, which this function takes ownership of.
+    @type  pixelcache: str
+    @param pixelcache: Filename of the decoded pixel buffer in the on-disk cache.
+    @return: Pointer to the SDL_Surface to use in place of img, which the caller must free.
+    """
+    # Store pixels in a fixed format so they can be mapped straight back in.
+    conv = SDL_ConvertSurfaceFormat(img, SDL_PIXELFORMAT_ARGB8888, 0)
+    if not conv:
+        return img
+    SDL_FreeSurface(img)
+    img = conv
+
+    w, h, pitch = img.contents.w, img.contents.h, img.contents.pitch
+
+    if SDL_MUSTLOCK(img.contents):
+        SDL_LockSurface(img)
+    pixels = string_at(img.contents.pixels, pitch * h)
+    if SDL_MUSTLOCK(img.contents):
+        SDL_UnlockSurface(img)
+
+    # Write to a temporary file first so a partial buffer is never picked up.
+    tmpname = "{0}.{1}.tmp".format(pixelcache, threading.get_ident())
+    try:
+        with open(tmpname, "wb") as f:
+            f.write(PIXELCACHE_HEADER.pack(PIXELCACHE_MAGIC, w, h, pitch))
+            f.write(pixels)
+        os.replace(tmpname, pixelcache)
+    except OSError:
         pass
-        # TODO: Complicated magic with Mix_LoadMUS_RW
+
+    return img
 
 
 class ImageFile:
     """This class represents and abstracts a single image file.
     """
 
-    def __init__(self, data, renderer):
+    def __init__(self, data, renderer, pixelcache=None, surface=None):
         """
         ImageFile class initializer.
 
         @type  data: bytes
         @param data: Image data from ResourceManager.
+        @type  pixelcache: str
+        @param pixelcache: (optional) Filename of the decoded pixel buffer for this image in the on-disk cache.
+        @param surface: (optional) Already decoded SDL_Surface of the image data, which this instance takes ownership of.
+            Whoever decoded it is responsible for the on-disk cache.
         """
         self.texture = None
         self.__renderer = renderer
-        self.__data = data
+        self.__pixelcache = pixelcache
+        self.__surface = surface
 
         # We need to save SDL's destructors because their continued existence is undefined during shutdown.
         self.__sdl_destroytexture = SDL_DestroyTexture
 
-        self.__load(self.__data)
+        # The data is not kept once the texture is built, it may be a memory map holding its file open.
+        self.__load(data)
 
         # Get image width and height.
         tw, th = c_int(), c_int()
@@ -70,12 +332,60 @@ class ImageFile:
 
     def __load(self, data):
         """
-        Load the image data with SDL_Image.
+        Load the image data with SDL_Image unless it was already decoded, or from the decoded pixel buffer if present in
+        the on-disk cache.
         """
-        if data:
-            img = IMG_Load_RW(SDL_RWFromConstMem(data, len(data)), 1)
+        img, self.__surface = self.__surface, None
+
+        if not img and self.__pixelcache and os.path.isfile(self.__pixelcache):
+            if self.__load_pixelcache():
+                return
+
+        if not img and data:
+            img = decode_image(data)
+            if img and self.__pixelcache:
+                img = save_pixelcache(img, self.__pixelcache)
+
+        if img:
+            self.texture = SDL_CreateTextureFromSurface(self.__renderer, img)
+            SDL_FreeSurface(img)
+
+    def __load_pixelcache(self):
+        """
+        Create the texture from a decoded pixel buffer mapped in from the on-disk cache.
+
+        Returns False if the buffer is missing, truncated or otherwise unusable, so the image is decoded instead.
+        """
+        try:
+            with open(self.__pixelcache, "rb") as f:
+                # A private mapping is writable for ctypes without copying the file into memory.
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return False
+
+        pixels = None
+        try:
+            if len(mm) < PIXELCACHE_HEADER.size:
+                return False
+
+            magic, w, h, pitch = PIXELCACHE_HEADER.unpack_from(mm)
+            if magic != PIXELCACHE_MAGIC or not w or not h or pitch < w * 4 or \
+                    len(mm) != PIXELCACHE_HEADER.size + pitch * h:
+                return False
+
+            pixels = (c_char * (pitch * h)).from_buffer(mm, PIXELCACHE_HEADER.size)
+            img = SDL_CreateRGBSurfaceWithFormatFrom(pixels, w, h, 32, pitch, SDL_PIXELFORMAT_ARGB8888)
+            if not img:
+                return False
+
             self.texture = SDL_CreateTextureFromSurface(self.__renderer, img)
             SDL_FreeSurface(img)
+            return bool(self.texture)
+
+        finally:
+            # The mapping can only be closed once nothing points into it.
+            pixels = None
+            mm.close()
 
     def __del__(self):
         if self.texture:
@@ -34,6 +34,7 @@ class Layer:
         tilemap: Parent Tilemap instance.
 
         properties: A dictionary containing layer properties.
+        hooks: A dictionary of ScriptHook instances for the layer's script events, mapped by event name.
 
         tiles: The list of Tile class instances for each tile.
     """
@@ -49,6 +50,7 @@ class Layer:
 
         self.zpos = zpos
         self.properties = {}
+        self.hooks = {}
 
         self.tiles = []
 
@@ -79,12 +81,19 @@ class Layer:
     def _process_objects(self, objdata):
         """Process and merge an object layer into the tile layer below.
 
+        Objects of type "entity" are not merged. They name the JSON entity descriptor to spawn at their position in
+        their "entity" property, and are returned for the Tilemap to spawn once the map is read.
+
         This method is marked private even though it's called from Tilemap, because it should not be called outside the
         engine code.
 
         Args:
             objdata: JSON object layer segment.
+
+        Returns: List of (filename, x, y) tuples of the entities to spawn on the layer.
         """
+        spawns = []
+
         if "properties" in objdata:
             self.properties.update(objdata["properties"])
 
@@ -95,6 +104,14 @@ class Layer:
                 self.tilemap.area.driftwood.log.msg("ERROR", "Map", "invalid object size or placement")
                 continue
 
+            # Entity spawns on object type "entity".
+            if obj["type"] == "entity":
+                if "properties" in obj and "entity" in obj["properties"]:
+                    spawns.append((obj["properties"]["entity"], obj["x"], obj["y"]))
+                else:
+                    self.tilemap.area.driftwood.log.msg("ERROR", "Map", "entity object has no descriptor")
+                continue
+
             # Map object properties onto their tiles.
             for x in range(0, obj["width"] // self.tilemap.tilewidth):
                 for y in range(0, obj["height"] // self.tilemap.tileheight):
@@ -113,9 +130,7 @@ class Layer:
                         if exittype in self.tile(tx, ty).properties:
                             self.tile(tx, ty).exits[exittype] = self.tile(tx, ty).properties[exittype]
 
-            # TODO: Handle entity spawns on object type "entity".
-            if obj["type"] == "entity":
-                pass
+        return spawns
 
     def tile(self, x, y):
         """Retrieve a tile from the layer by its coordinates.
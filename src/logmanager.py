@@ -57,6 +57,14 @@ class LogManager:
         if self.driftwood.config["log"]["halt"]:
             self.driftwood.running = False
 
+    def warn(self, *chain):
+        """Log a warning which is always shown but never halts the engine, for problems a developer should notice.
+
+        Args:
+            chain: A list of strings to be separated by colon-spaces and printed.
+        """
+        self.__print(chain)
+
     def info(self, *chain):
         """Log an info message if verbosity is enabled..
 
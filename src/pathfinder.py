@@ -0,0 +1,363 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## pathfinder.py                 ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import collections
+import concurrent.futures
+import heapq
+
+# Steps between neighboring tiles, as (x, y) offsets.
+STEPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+
+def blocks(nowalk, player):
+    """Determine whether a tile's nowalk value keeps an entity off of it.
+
+    Args:
+        nowalk: The tile's nowalk value. None means the tile is walkable, "player" or "npc" block only the player or
+            only other entities, and any other value, including "", blocks everyone.
+        player: Whether the entity is the player.
+
+    Returns: True if the entity may not walk onto the tile, False otherwise.
+    """
+    if nowalk is None or (not nowalk and nowalk != ""):
+        return False
+    if nowalk == "player":
+        return player
+    if nowalk == "npc":
+        return not player
+    return True
+
+
+def astar(grid, width, height, start, goal, limit=0):
+    """Find the shortest 4-connected path across a walkability grid.
+
+    This only reads its arguments, so it is safe to run on a worker thread.
+
+    Args:
+        grid: Bytes-like row-major grid of the map, nonzero where a tile is not walkable.
+        width: Width of the grid in tiles.
+        height: Height of the grid in tiles.
+        start: (x, y) tile to start from.
+        goal: (x, y) tile to reach.
+        limit: (optional) Give up after visiting this many tiles, if nonzero.
+
+    Returns: List of (x, y) tiles to walk through after the start, ending with the goal, or None if there is no path.
+    """
+    sx, sy = start
+    gx, gy = goal
+    if not (0 <= sx < width and 0 <= sy < height and 0 <= gx < width and 0 <= gy < height) or grid[gy * width + gx]:
+        return None
+
+    begin = sy * width + sx
+    end = gy * width + gx
+    came_from = {begin: None}
+    cost = {begin: 0}
+    frontier = [(abs(gx - sx) + abs(gy - sy), 0, begin)]
+    visited = 0
+
+    while frontier:
+        f, g, i = heapq.heappop(frontier)
+        if i == end:
+            break
+        if g > cost[i]:
+            continue  # We already got here a cheaper way.
+
+        visited += 1
+        if limit and visited > limit:
+            return None
+
+        x, y = i % width, i // width
+        for dx, dy in STEPS:
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            n = ny * width + nx
+            if grid[n] or (n in cost and cost[n] <= g + 1):
+                continue
+            cost[n] = g + 1
+            came_from[n] = i
+            # Ties go to the tile closer to the goal, which keeps the search narrow on open ground.
+            heapq.heappush(frontier, (g + 1 + abs(gx - nx) + abs(gy - ny), g + 1, n))
+
+    else:
+        return None
+
+    path = []
+    i = end
+    while i != begin:
+        path.append((i % width, i // width))
+        i = came_from[i]
+    path.reverse()
+    return path
+
+
+class FlowField:
+    """This class holds the distance from every tile of a layer to a shared goal tile.
+
+    Any number of entities heading for the same goal can look up their next step in it, instead of each searching for
+    a path.
+
+    Attributes:
+        goal: (x, y) tile the field leads to.
+        width: Width of the field in tiles.
+        height: Height of the field in tiles.
+    """
+
+    def __init__(self, grid, width, height, goal):
+        """FlowField class initializer, which fills in the field.
+
+        Args:
+            grid: Bytes-like row-major grid of the map, nonzero where a tile is not walkable.
+            width: Width of the grid in tiles.
+            height: Height of the grid in tiles.
+            goal: (x, y) tile to lead to.
+        """
+        self.goal = goal
+        self.width = width
+        self.height = height
+
+        # Distance in steps from each tile to the goal, or -1 if the goal can't be reached from it.
+        self.__distance = [-1] * (width * height)
+
+        gx, gy = goal
+        if not (0 <= gx < width and 0 <= gy < height) or grid[gy * width + gx]:
+            return
+
+        # Breadth-first search outward from the goal.
+        self.__distance[gy * width + gx] = 0
+        queue = collections.deque([gy * width + gx])
+        while queue:
+            i = queue.popleft()
+            x, y = i % width, i // width
+            for dx, dy in STEPS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    n = ny * width + nx
+                    if self.__distance[n] == -1 and not grid[n]:
+                        self.__distance[n] = self.__distance[i] + 1
+                        queue.append(n)
+
+    def distance(self, x, y):
+        """Retrieve the distance from a tile to the goal.
+
+        Args:
+            x: x-coordinate of the tile.
+            y: y-coordinate of the tile.
+
+        Returns: Number of steps to the goal, or None if it can't be reached from the tile.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height) or self.__distance[y * self.width + x] == -1:
+            return None
+        return self.__distance[y * self.width + x]
+
+    def direction(self, x, y):
+        """Retrieve the direction to step in from a tile to get closer to the goal.
+
+        Args:
+            x: x-coordinate of the tile.
+            y: y-coordinate of the tile.
+
+        Returns: (x, y) velocity suitable for TileModeEntity.set_next_velocity(), which is (0, 0) at the goal, or None
+            if the goal can't be reached from the tile.
+        """
+        here = self.distance(x, y)
+        if here is None:
+            return None
+
+        for dx, dy in STEPS:
+            there = self.distance(x + dx, y + dy)
+            if there is not None and there < here:
+                return dx, dy
+
+        return 0, 0
+
+
+class Pathfinder:
+    """This class finds paths across the layers of the current area.
+
+    It keeps a compact walkability grid for each layer, built from the tiles' nowalk values, separately for the player
+    and for other entities. Flow fields toward shared goals are cached. Both are thrown away when another area is
+    focused, and a layer's are thrown away whenever the nowalk value of one of its tiles is set.
+
+    Attributes:
+        area: Parent AreaManager instance.
+    """
+
+    def __init__(self, areamanager):
+        """Pathfinder class initializer.
+
+        Args:
+            areamanager: Link back to the parent AreaManager instance.
+        """
+        self.area = areamanager
+
+        # Dictionary of walkability grids mapped by (layer, player) tuples.
+        self.__grids = {}
+
+        # Most recently used flow fields, mapped by (layer, goal, player) tuples.
+        self.__fields = collections.OrderedDict()
+        self.__fields_max = 16
+
+        # Worker thread for background searches, and a list of (future, callback) tuples for searches in progress.
+        self.__executor = None
+        self.__searches = []
+
+    def grid(self, layer, player=False):
+        """Retrieve the walkability grid of a layer.
+
+        Args:
+            layer: Layer to get the grid of.
+            player: (optional) Whether to get the grid the player walks on, rather than the one other entities do.
+
+        Returns: Row-major bytes of the layer, one per tile, nonzero where a tile is not walkable.
+        """
+        key = (layer, bool(player))
+
+        if key not in self.__grids:
+            tilemap = self.area.tilemap
+            grid = bytearray(tilemap.width * tilemap.height)
+            for t in tilemap.layers[layer].tiles:
+                if blocks(t.nowalk, player):
+                    grid[t.seq] = 1
+            self.__grids[key] = bytes(grid)
+
+        return self.__grids[key]
+
+    def walkable(self, layer, x, y, player=False):
+        """Check whether a tile is walkable.
+
+        Args:
+            layer: Layer of the tile.
+            x: x-coordinate of the tile.
+            y: y-coordinate of the tile.
+            player: (optional) Whether to check for the player, rather than for other entities.
+
+        Returns: True if the tile is on the map and walkable, False otherwise.
+        """
+        tilemap = self.area.tilemap
+        if not (0 <= x < tilemap.width and 0 <= y < tilemap.height):
+            return False
+        return not self.grid(layer, player)[y * tilemap.width + x]
+
+    def find(self, layer, start, goal, player=False, limit=0):
+        """Find the shortest path between two tiles on a layer.
+
+        Args:
+            layer: Layer to search on.
+            start: (x, y) tile to start from.
+            goal: (x, y) tile to reach.
+            player: (optional) Whether to search for the player, rather than for other entities.
+            limit: (optional) Give up after visiting this many tiles, if nonzero.
+
+        Returns: List of (x, y) tiles to walk through after the start, ending with the goal, or None if there is no
+            path.
+        """
+        tilemap = self.area.tilemap
+        return astar(self.grid(layer, player), tilemap.width, tilemap.height, tuple(start), tuple(goal), limit)
+
+    def find_async(self, layer, start, goal, callback, player=False, limit=0):
+        """Find the shortest path between two tiles on a layer on a worker thread.
+
+        The callback is called from a tick callback on the main loop once the search is done, with the same result
+        find() would return.
+
+        Args:
+            layer: Layer to search on.
+            start: (x, y) tile to start from.
+            goal: (x, y) tile to reach.
+            callback: Function to call with the path.
+            player: (optional) Whether to search for the player, rather than for other entities.
+            limit: (optional) Give up after visiting this many tiles, if nonzero.
+        """
+        if not self.__executor:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        tilemap = self.area.tilemap
+        future = self.__executor.submit(astar, self.grid(layer, player), tilemap.width, tilemap.height, tuple(start),
+                                        tuple(goal), limit)
+
+        self.__searches.append((future, callback))
+        self.area.driftwood.tick.register(self.__search_tick)
+
+    def flow_field(self, layer, goal, player=False):
+        """Retrieve the flow field toward a goal tile on a layer, building it if it is not cached.
+
+        Args:
+            layer: Layer the goal is on.
+            goal: (x, y) tile to lead to.
+            player: (optional) Whether the field is for the player, rather than for other entities.
+
+        Returns: FlowField instance.
+        """
+        key = (layer, tuple(goal), bool(player))
+
+        if key in self.__fields:
+            self.__fields.move_to_end(key)
+        else:
+            tilemap = self.area.tilemap
+            self.__fields[key] = FlowField(self.grid(layer, player), tilemap.width, tilemap.height, key[1])
+            if len(self.__fields) > self.__fields_max:
+                self.__fields.popitem(last=False)
+
+        return self.__fields[key]
+
+    def prepare(self):
+        """Build the walkability grids of every layer ahead of time, so the first collision checks after an area loads
+        don't have to.
+        """
+        for layer in range(len(self.area.tilemap.layers)):
+            self.grid(layer)
+            self.grid(layer, True)
+
+    def invalidate(self, layer=None):
+        """Forget the walkability grids and flow fields of a layer, after its tiles' nowalk values changed.
+
+        Tiles call this themselves when their nowalk is set.
+
+        Args:
+            layer: (optional) Layer to forget, or None for all of them.
+        """
+        if layer is None:
+            self.__grids.clear()
+            self.__fields.clear()
+            return
+
+        for key in [key for key in self.__grids if key[0] == layer]:
+            del self.__grids[key]
+        for key in [key for key in self.__fields if key[0] == layer]:
+            del self.__fields[key]
+
+    def __search_tick(self, millis_past):
+        """Tick callback which hands finished background searches to their callbacks.
+        """
+        for search in list(self.__searches):
+            future, callback = search
+            if future.done():
+                self.__searches.remove(search)
+                callback(future.result())
+
+        if not self.__searches:
+            self.area.driftwood.tick.unregister(self.__search_tick)
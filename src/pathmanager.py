@@ -24,19 +24,44 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import fnmatch
+import json
+import mmap
 import os
+import posixpath
 import zipfile
+import zlib
+
+import resourcepack
+
+# Version of the persisted index format.
+INDEX_VERSION = 2
+
+# Most listings of pathnames off the path to keep, so that a pathname added again later is not rescanned.
+INDEX_OFF_PATH = 32
 
 
 class PathManager:
     """The Path Manager
 
     Simple path abstraction class which maintains a list of data pathnames and a simple virtual filesystem for files
-    therein. The class supports directories and zip archives as valid pathnames.
+    therein. The class supports directories, zip archives and Driftwood resource packs as valid pathnames.
 
     The last item on the path has the highest priority; if a file exists in multiple pathnames, the last occurence is
     the only one recorded in the virtual filesystem.
 
+    Files are addressed by their path relative to the pathname, with '/' as the separator, no matter whether the
+    pathname is a directory or a zip archive. The virtual filesystem is also indexed by directory, so that listing a
+    directory or globbing inside it does not depend on the total number of files.
+
+    Zip archives are kept open in a pool along with an index of their members, so that reading a file does not
+    re-parse the archive's central directory. Resource packs are kept open and memory mapped in the same way.
+
+    The file listing of each pathname is kept between rebuilds along with a signature (directory modification times,
+    or archive size, modification time and a checksum of the archive's tail), and a pathname is only rescanned when
+    its signature changes. If an index file is configured, the listings are persisted there across runs. Listings of
+    pathnames which leave the path are kept too, up to INDEX_OFF_PATH of the most recently used ones.
+
     Attributes:
         driftwood: Base class instance.
     """
@@ -51,6 +76,37 @@ class PathManager:
 
         self.__vfs = {}
 
+        # Dictionary of virtual directories mapped by directory path ("" is the top). Each is a dictionary of entry
+        # names mapped to True for subdirectories and False for files.
+        self.__tree = {"": {}}
+
+        # Dictionary of pathname listings mapped by pathname, least recently on the path first.
+        #
+        # Dict Keys:
+        #     signature: Signature of the pathname when it was scanned, or None if it could not be scanned.
+        #     files: List of files inside the pathname.
+        self.__listings = {}
+
+        # Dictionary of file sets mapped by pathname, for membership tests on a specific pathname.
+        self.__members = {}
+
+        # Filename of the persisted listings index, if any.
+        self.__index = None
+        if "index" in self.driftwood.config["path"] and self.driftwood.config["path"]["index"]:
+            self.__index = self.driftwood.config["path"]["index"]
+            self.__load_index()
+
+        # Dictionary of open zip archives mapped by pathname.
+        #
+        # Dict Keys:
+        #     zipfile: The open ZipFile instance.
+        #     index: Dictionary of ZipInfo instances mapped by member filename.
+        #     mmap: Private memory map of the whole archive, or None if not mapped yet.
+        self.__archives = {}
+
+        # Dictionary of open ResourcePack instances mapped by pathname.
+        self.__packs = {}
+
         self.__root = self.driftwood.config["path"]["root"] # Path root.
         self.__path = [self.driftwood.config["path"]["self"]] # Start with base module.
 
@@ -79,30 +135,23 @@ class PathManager:
         Returns:
             Tuple of files inside the pathname.
         """
-        filelist = []
-
         try:
-            # This is a directory.
-            if os.path.isdir(pathname):
-                for root, dirs, files in os.walk(pathname):
-                    for name in files:
-                        filelist.append(name)
-
-            # This is hopefully a zip archive.
-            else:
-                with zipfile.ZipFile(pathname, 'r') as zf:
-                    for name in zf.namelist():
-                        filelist.append(name)
+            return tuple(self.__scan(pathname)["files"])
 
         except:
             self.driftwood.log.msg("ERROR", "Path", "could not examine pathname", pathname)
+            return ()
 
-        return tuple(filelist)
+        finally:
+            # Only archives on the path are kept open.
+            if pathname not in self.__path:
+                self.__close_archive(pathname)
 
     def rebuild(self):
         """Rebuild the vfs.
 
-        Rebuild the virtual filesystem from the path list, and make sure the base module is at the top.
+        Rebuild the virtual filesystem from the path list, and make sure the base module is at the top. Only pathnames
+        which are new or have changed since they were last scanned are examined again.
         """
         basepath = self.driftwood.config["path"]["self"]
 
@@ -112,13 +161,315 @@ class PathManager:
                 self.__path.remove(basepath)
             self.__path.insert(0, basepath)
 
-        # Scan all pathnames for the files they contain and rebuild the vfs.
+        # Close archives off the path. Their listings are kept, since they are checked again before any reuse.
+        for pathname in list(self.__archives) + list(self.__packs):
+            if pathname not in self.__path:
+                self.__close_archive(pathname)
+
+        # Membership sets of pathnames off the path were only examined once, so drop them too.
+        for pathname in list(self.__members):
+            if pathname not in self.__path:
+                del self.__members[pathname]
+
+        # Rescan new or changed pathnames.
+        rescanned = []
+        for pathname in self.__path:
+            if not self.__is_current(pathname):
+                self.__close_archive(pathname)  # It may have changed.
+                try:
+                    self.__listings[pathname] = self.__scan(pathname)
+
+                except:
+                    self.driftwood.log.msg("ERROR", "Path", "could not examine pathname", pathname)
+                    self.__listings[pathname] = {"signature": None, "files": []}
+
+                rescanned.append(pathname)
+
+            if pathname in rescanned or pathname not in self.__members:
+                self.__members[pathname] = frozenset(self.__listings[pathname]["files"])
+
+        # Move the listings on the path to the end, and only keep the most recently used of the rest.
+        order = list(self.__listings)
+        for pathname in self.__path:
+            self.__listings[pathname] = self.__listings.pop(pathname)
+        offpath = [pathname for pathname in self.__listings if pathname not in self.__path]
+        for pathname in offpath[:max(0, len(offpath) - INDEX_OFF_PATH)]:
+            del self.__listings[pathname]
+
+        # Rebuild the vfs from the listings.
+        self.__vfs = {}
         for pathname in self.__path:
-            filelist = self.examine(pathname)
-            for name in filelist:
+            for name in self.__listings[pathname]["files"]:
                 self.__vfs[name] = pathname
 
-        self.driftwood.log.info("Path", "rebuilt")
+        # Rebuild the directory tree from the vfs.
+        self.__tree = {"": {}}
+        for name in self.__vfs:
+            self.__tree_insert(name)
+
+        if self.__index and (rescanned or list(self.__listings) != order):
+            self.__save_index()
+
+        self.driftwood.log.info("Path", "rebuilt", "{0} pathname(s) rescanned".format(len(rescanned)))
+
+    def pathnames(self):
+        """Retrieve the path list.
+
+        Returns:
+            Tuple of pathnames in the path, from lowest to highest priority.
+        """
+        return tuple(self.__path)
+
+    def archive(self, pathname):
+        """Retrieve the open ZipFile instance for a zip archive pathname, opening it if necessary.
+
+        Args:
+            pathname: Pathname of the zip archive.
+
+        Returns:
+            ZipFile instance if succeeded, None if failed.
+        """
+        try:
+            return self.__open_archive(pathname)["zipfile"]
+
+        except:
+            self.driftwood.log.msg("ERROR", "Path", "could not open archive", pathname)
+
+    def zipinfo(self, filename, pathname):
+        """Retrieve the ZipInfo of a file in a zip archive pathname from the archive's index.
+
+        Args:
+            filename: Filename of the member.
+            pathname: Pathname of the zip archive.
+
+        Returns:
+            ZipInfo instance if present, None otherwise.
+        """
+        try:
+            index = self.__open_archive(pathname)["index"]
+
+        except:
+            self.driftwood.log.msg("ERROR", "Path", "could not open archive", pathname)
+            return None
+
+        filename = self.normalize(filename)
+        if filename in index:
+            return index[filename]
+
+    def archive_map(self, pathname):
+        """Retrieve a private memory map of a zip archive pathname, mapping it if necessary.
+
+        The map is copy-on-write, so buffers taken from it are writable without touching the archive.
+
+        Args:
+            pathname: Pathname of the zip archive.
+
+        Returns:
+            mmap instance if succeeded, None if failed.
+        """
+        try:
+            archive = self.__open_archive(pathname)
+            if not archive["mmap"]:
+                with open(pathname, 'rb') as f:
+                    archive["mmap"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            return archive["mmap"]
+
+        except:
+            self.driftwood.log.msg("ERROR", "Path", "could not map archive", pathname)
+
+    def pack(self, pathname):
+        """Retrieve the open ResourcePack instance for a resource pack pathname, opening it if necessary.
+
+        Args:
+            pathname: Pathname of the resource pack.
+
+        Returns:
+            ResourcePack instance if succeeded, None if failed.
+        """
+        try:
+            return self.__open_pack(pathname)
+
+        except:
+            self.driftwood.log.msg("ERROR", "Path", "could not open resource pack", pathname)
+
+    def kind(self, pathname):
+        """Determine the kind of a pathname.
+
+        Args:
+            pathname: Pathname to check.
+
+        Returns:
+            "dir" for a directory, "pack" for a resource pack, or "zip" for anything else.
+        """
+        if pathname in self.__listings and self.__listings[pathname]["signature"]:
+            return self.__listings[pathname]["signature"]["type"]
+
+        if os.path.isdir(pathname):
+            return "dir"
+
+        if pathname in self.__packs or resourcepack.ispack(pathname):
+            return "pack"
+
+        return "zip"
+
+    def close(self):
+        """Close all open zip archives and resource packs.
+
+        Memory maps are only dropped, not closed, because buffers into them may still be held by the cache. They are
+        closed once the last such buffer is released.
+        """
+        for pathname in self.__archives:
+            self.__archives[pathname]["zipfile"].close()
+
+        for pathname in self.__packs:
+            self.__packs[pathname].close()
+
+        self.__archives = {}
+        self.__packs = {}
+
+    def __close_archive(self, pathname):
+        """Remove a zip archive or resource pack from the pool if present.
+        """
+        if pathname in self.__archives:
+            self.__archives[pathname]["zipfile"].close()
+            del self.__archives[pathname]
+
+        if pathname in self.__packs:
+            self.__packs[pathname].close()
+            del self.__packs[pathname]
+
+    def __scan(self, pathname):
+        """Scan a pathname for the files it contains and compute its signature.
+
+        Raises an exception on failure.
+        """
+        filelist = []
+
+        # This is a directory.
+        if os.path.isdir(pathname):
+            dirs = {}
+            for root, subdirs, files in os.walk(pathname):
+                reldir = os.path.relpath(root, pathname)
+                dirs[reldir] = os.stat(root).st_mtime_ns
+                for name in files:
+                    filelist.append(self.normalize(os.path.join(reldir, name)))
+            signature = {"type": "dir", "dirs": dirs}
+
+        # This is a resource pack.
+        elif resourcepack.ispack(pathname):
+            filelist.extend(self.__open_pack(pathname).namelist())
+            signature = self.__archive_signature(pathname, "pack")
+
+        # This is hopefully a zip archive.
+        else:
+            filelist.extend(self.__open_archive(pathname)["index"])
+            signature = self.__archive_signature(pathname, "zip")
+
+        return {"signature": signature, "files": filelist}
+
+    def __is_current(self, pathname):
+        """Check whether the recorded listing of a pathname is still valid.
+        """
+        if pathname not in self.__listings or not self.__listings[pathname]["signature"]:
+            return False
+
+        signature = self.__listings[pathname]["signature"]
+
+        try:
+            if os.path.isdir(pathname):
+                if signature["type"] != "dir":
+                    return False
+
+                # A directory's mtime changes whenever an entry is added, removed or renamed in it.
+                for d in signature["dirs"]:
+                    if os.stat(os.path.join(pathname, d)).st_mtime_ns != signature["dirs"][d]:
+                        return False
+                return True
+
+            return signature == self.__archive_signature(pathname, signature["type"])
+
+        except OSError:
+            return False
+
+    def __archive_signature(self, pathname, kind):
+        """Compute the signature of a zip archive or resource pack: its size, mtime and a checksum of the tail holding
+        the central directory or index.
+        """
+        st = os.stat(pathname)
+        with open(pathname, 'rb') as f:
+            f.seek(max(0, st.st_size - 65536))
+            crc = zlib.crc32(f.read())
+
+        return {"type": kind, "size": st.st_size, "mtime": st.st_mtime_ns, "crc": crc}
+
+    def __tree_insert(self, name):
+        """Insert a file and its parent directories into the directory tree.
+        """
+        dirname, basename = posixpath.split(name)
+        isdir = False
+
+        while True:
+            if dirname in self.__tree:
+                self.__tree[dirname][basename] = isdir
+                return
+
+            self.__tree[dirname] = {basename: isdir}
+            dirname, basename = posixpath.split(dirname)
+            isdir = True
+
+    def __load_index(self):
+        """Load the persisted pathname listings.
+        """
+        if not os.path.isfile(self.__index):
+            return
+
+        try:
+            with open(self.__index, 'r') as f:
+                index = json.load(f)
+
+            # Listings from an older index format cannot be trusted.
+            if index["version"] == INDEX_VERSION:
+                self.__listings = index["listings"]
+
+        except:
+            self.driftwood.log.info("Path", "ignoring unreadable index", self.__index)
+            self.__listings = {}
+
+    def __save_index(self):
+        """Persist the pathname listings.
+        """
+        try:
+            with open(self.__index + ".tmp", 'w') as f:
+                json.dump({"version": INDEX_VERSION, "listings": self.__listings}, f)
+            os.replace(self.__index + ".tmp", self.__index)
+
+        except OSError:
+            self.driftwood.log.info("Path", "could not write index", self.__index)
+
+    def __open_archive(self, pathname):
+        """Open and index a zip archive if it is not already in the pool.
+
+        Raises an exception on failure.
+        """
+        if pathname not in self.__archives:
+            zf = zipfile.ZipFile(pathname, 'r')
+            index = {}
+            for info in zf.infolist():
+                if not info.filename.endswith('/'):
+                    index[info.filename] = info
+            self.__archives[pathname] = {"zipfile": zf, "index": index, "mmap": None}
+
+        return self.__archives[pathname]
+
+    def __open_pack(self, pathname):
+        """Open a resource pack if it is not already in the pool.
+
+        Raises an exception on failure.
+        """
+        if pathname not in self.__packs:
+            self.__packs[pathname] = resourcepack.ResourcePack(pathname)
+
+        return self.__packs[pathname]
 
     def prepend(self, pathnames):
         """Prepend pathnames to the path list.
@@ -203,7 +554,8 @@ class PathManager:
         """Find a filename's pathname.
 
         Return the pathname which owns the filename, if present. If pathname is set, check that specific pathname for
-        existence of the file instead of checking the path list.
+        existence of the file instead of checking the path list. Pathnames on the path are checked against their
+        listing from the last rebuild; other pathnames are examined once and remembered until the next rebuild.
 
         Args:
             filename: The filename whose pathname to find.
@@ -212,8 +564,73 @@ class PathManager:
         Returns:
             The pathname which owns the filename, if any.
         """
+        filename = self.normalize(filename)
+
         if pathname:
-            if filename in self.examine(pathname):
+            if pathname not in self.__members:
+                self.__members[pathname] = frozenset(self.examine(pathname))
+            if filename in self.__members[pathname]:
                 return pathname
         elif filename in self.__vfs:
             return self.__vfs[filename]
+
+    def listdir(self, dirname=""):
+        """List a directory in the vfs.
+
+        Args:
+            dirname: (optional) Path of the directory to list. Defaults to the top of the vfs.
+
+        Returns:
+            Sorted tuple of entry names in the directory. Subdirectories end with '/'. Empty if there is no such
+            directory.
+        """
+        dirname = self.normalize(dirname)
+
+        if dirname not in self.__tree:
+            return ()
+
+        entries = self.__tree[dirname]
+        return tuple(sorted(name + '/' if entries[name] else name for name in entries))
+
+    def glob(self, pattern):
+        """Find files in the vfs matching a shell-style pattern.
+
+        Only the directories matching the pattern's directory part are searched, so a pattern like "maps/*.json" only
+        costs as much as the size of "maps/".
+
+        Args:
+            pattern: Pattern relative to the top of the vfs, such as "maps/*.json" or "*/npc_*.json".
+
+        Returns:
+            Sorted tuple of matching filenames.
+        """
+        pattern = self.normalize(pattern)
+        dirpattern, namepattern = posixpath.split(pattern)
+
+        # Find the directories to search.
+        if not any(c in dirpattern for c in "*?["):
+            dirs = [dirpattern] if dirpattern in self.__tree else []
+        else:
+            dirs = fnmatch.filter(self.__tree.keys(), dirpattern)
+
+        matches = []
+        for d in dirs:
+            for name in fnmatch.filter(self.__tree[d].keys(), namepattern):
+                if not self.__tree[d][name]:
+                    matches.append(posixpath.join(d, name))
+
+        return tuple(sorted(matches))
+
+    def normalize(self, filename):
+        """Normalize a filename to its form in the vfs.
+
+        Args:
+            filename: Filename to normalize, with either '/' or the native separator.
+
+        Returns:
+            Filename relative to the top of the vfs with '/' as the separator, or "" for the top itself.
+        """
+        filename = posixpath.normpath(filename.replace(os.sep, '/')).lstrip('/')
+        if filename == '.':
+            return ""
+        return filename
@@ -24,18 +24,44 @@
 ## IN THE SOFTWARE.
 ## **********
 
+import collections
+import concurrent.futures
+import hashlib
 import json
+import marshal
+import mmap
 import os
+import struct
 import zipfile
 
+from sdl2 import SDL_FreeSurface
+
 import filetype
 
+# Extensions of files which prefetching decodes as images.
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tga")
+
+# Layout of the fixed part of a zip local file header.
+ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+ZIP_LOCAL_SIGNATURE = b"PK\x03\x04"
+
 
 class ResourceManager:
     """The Resource Manager
 
     Simple resource management class which retrieves the contents of a file in the path vfs.
 
+    If an on-disk cache directory is configured, decoded images and parsed JSON files are stored there keyed by the
+    location, size and modification time of their source, and mapped back in on later runs instead of being decoded
+    again.
+
+    Files can also be read in batches by a pool of worker threads, either synchronously with request_many() or in the
+    background with prefetch(). Prefetched files are handed to the cache, and prefetched images are decoded in the
+    workers so that request_image() only has to upload them to a texture.
+
+    Images can also be requested asynchronously with request_image_async(). They are decoded on the worker threads, and
+    only the texture upload runs on the main loop, limited to a configured number of uploads per tick.
+
     Attributes:
         driftwood: Base class instance.
 
@@ -49,6 +75,53 @@ class ResourceManager:
         """
         self.driftwood = driftwood
 
+        # Directory of the on-disk cache, if enabled.
+        self.__diskcache = None
+
+        if "disk" in self.driftwood.config["cache"] and self.driftwood.config["cache"]["disk"]:
+            self.__diskcache = self.driftwood.config["cache"]["disk"]
+
+            # Make sure the on-disk cache directory exists.
+            try:
+                if not os.path.isdir(self.__diskcache):
+                    os.makedirs(self.__diskcache)
+            except OSError:
+                self.driftwood.log.msg("ERROR", "Resource", "cannot create disk cache directory", self.__diskcache)
+                self.__diskcache = None
+
+        # Worker thread pool for batch reads, created when first needed.
+        self.__executor = None
+
+        # Dictionary of futures for files being read in the background mapped by filename.
+        self.__inflight = {}
+
+        # List of dicts representing prefetch batches.
+        #
+        # Dict Keys:
+        #     filenames: Tuple of filenames in the batch.
+        #     futures: Dictionary of futures not yet seen completed mapped by filename.
+        #     callback: Function to call with the filenames when the batch completes, or None.
+        self.__batches = []
+
+        # Dictionary of prefetched, decoded SDL_Surfaces waiting for request_image() mapped by filename.
+        self.__surfaces = {}
+
+        # List of dicts representing asynchronous image requests, first those being decoded and then those waiting
+        # for their texture upload.
+        #
+        # Dict Keys:
+        #     filename: Filename of the image.
+        #     future: Future of the read and decode (only while decoding).
+        #     contents: Contents of the image file (only once decoded).
+        #     surface: Decoded SDL_Surface, or None to decode on upload (only once decoded).
+        #     callback: Function to call with the ImageFile instance.
+        self.__decoding = []
+        self.__uploads = []
+
+        # Decoded sound effects, least recently used first, mapped by filename, and their total size in bytes.
+        self.__sounds = collections.OrderedDict()
+        self.__sounds_size = 0
+
     def __contains__(self, item):
         if self.driftwood.path[item]:
             return True
@@ -60,6 +133,10 @@ class ResourceManager:
     def request(self, filename, binary = False):
         """Retrieve the contents of a file.
 
+        Binary files in directories and binary files stored uncompressed in zip archives or resource packs are not copied
+        into memory; their contents are returned as a memoryview of a private memory map. Each map of a file in a
+        directory holds a file descriptor, so those are not kept in the cache and are mapped again on the next request.
+
         Args:
             filename: Filename of the file to read.
             binary: Whether the file is a binary file, rather than a plaintext file.
@@ -67,31 +144,21 @@ class ResourceManager:
         Returns:
             Contents of the requested file, if present.
         """
+        filename = self.driftwood.path.normalize(filename)
         self.driftwood.log.info("Resource", "requested", filename)
 
         # If the file is already cached, return the cached version.
-        if filename in self.driftwood.cache:
-            return self.driftwood.cache[filename]
+        contents = self.driftwood.cache.download(filename)
+        if contents is not None:
+            return contents
 
         pathname = self.driftwood.path[filename]
         if pathname:
             try:
-                # This is a directory.
-                if os.path.isdir(pathname):
-                    if binary:
-                        f = open(os.path.join(pathname, filename), "rb")
-                    else:
-                        f = open(os.path.join(pathname, filename))
-                    contents = f.read()
-                    f.close()
-
-                # This is hopefully a zip archive.
-                else:
-                    with zipfile.ZipFile(pathname, 'r') as zf:
-                        contents = zf.read(filename)
+                contents = self.__read(filename, pathname, binary)
 
                 # Upload the file to the cache.
-                self.driftwood.cache.upload(filename, contents)
+                self.__upload(filename, contents)
 
                 return contents
 
@@ -101,17 +168,492 @@ class ResourceManager:
         else:
             self.driftwood.log.msg("ERROR", "Resource", "no such file", filename)
 
+    def request_many(self, filenames, binary=False):
+        """Retrieve the contents of several files, reading them in parallel.
+
+        Args:
+            filenames: List of filenames of the files to read.
+            binary: Whether the files are binary files, rather than plaintext files.
+
+        Returns:
+            Dictionary of the contents of each file that could be read, mapped by filename.
+        """
+        results = {}
+        futures = {}
+
+        for filename in filenames:
+            filename = self.driftwood.path.normalize(filename)
+            contents = self.driftwood.cache.download(filename)
+            if contents is not None:
+                results[filename] = contents
+            elif filename not in futures:
+                future = self.__submit(filename, binary, False)
+                if future:
+                    futures[filename] = future
+
+        for filename in futures:
+            try:
+                contents = futures[filename].result()[0]
+                self.__upload(filename, contents)
+                results[filename] = contents
+
+            except:
+                self.driftwood.log.msg("ERROR", "Resource", "could not read file", filename)
+
+        self.driftwood.log.info("Resource", "requested", "{0} file(s)".format(len(results)))
+
+        return results
+
+    def prefetch(self, filenames, callback=None):
+        """Read files into the cache in the background.
+
+        Image files are read as binary files and decoded, other files are read as plaintext files. Results are handed
+        over on the main loop by a tick callback.
+
+        Args:
+            filenames: List of filenames of the files to read.
+            callback: (optional) Function to call with a tuple of the filenames once they have all been read.
+        """
+        batch = {"filenames": [], "futures": {}, "callback": callback}
+
+        for filename in filenames:
+            filename = self.driftwood.path.normalize(filename)
+            batch["filenames"].append(filename)
+
+            if filename in self.__inflight:
+                batch["futures"][filename] = self.__inflight[filename]
+
+            elif filename not in self.driftwood.cache and filename not in self.__surfaces:
+                image = filename.lower().endswith(IMAGE_EXTENSIONS)
+                future = self.__submit(filename, image, image)
+                if future:
+                    self.__inflight[filename] = future
+                    batch["futures"][filename] = future
+
+        batch["filenames"] = tuple(batch["filenames"])
+        self.__batches.append(batch)
+        self.driftwood.tick.register(self.__prefetch_tick)
+
+        self.driftwood.log.info("Resource", "prefetching", "{0} file(s)".format(len(batch["futures"])))
+
     def request_json(self, filename):
         data = self.request(filename)
         if data:
+            cachefile = self.__diskcache_filename(filename, ".json.{0}".format(marshal.version))
+
+            # Use the pre-parsed copy from the on-disk cache if present.
+            if cachefile and os.path.isfile(cachefile):
+                try:
+                    with open(cachefile, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        return marshal.loads(mm)
+                except (OSError, ValueError, EOFError, TypeError):
+                    pass
+
             if type(data) == bytes:
                 data = data.decode()
-            return json.loads(data)
+            parsed = json.loads(data)
+
+            if cachefile:
+                self.__diskcache_write(cachefile, marshal.dumps(parsed))
+
+            return parsed
 
     def request_image(self, filename):
+        filename = self.driftwood.path.normalize(filename)
         data = self.request(filename, True)
         if data:
-            return filetype.ImageFile(data, self.driftwood.window.renderer)
+            # Use the surface decoded by a prefetch if there is one.
+            surface = None
+            if filename in self.__surfaces:
+                surface = self.__surfaces.pop(filename)
+
+            return filetype.ImageFile(data, self.driftwood.window.renderer,
+                                      self.__diskcache_filename(filename, ".pixels"), surface)
+
+    def request_image_async(self, filename, callback):
+        """Request an image without blocking the main loop.
+
+        The image is read and decoded on a worker thread, and its texture is uploaded on a later tick.
+
+        Args:
+            filename: Filename of the image.
+            callback: Function to call with the filetype.ImageFile instance once it is ready.
+
+        Returns:
+            True if the request was queued, False if the file does not exist.
+        """
+        filename = self.driftwood.path.normalize(filename)
+
+        # Already decoded by a prefetch.
+        if filename in self.__surfaces:
+            contents = self.request(filename, True)
+            if contents is None:
+                return False
+            self.__uploads.append({"filename": filename, "contents": contents,
+                                   "surface": self.__surfaces.pop(filename), "callback": callback})
+
+        else:
+            contents = self.driftwood.cache.download(filename)
+
+            # Already read, only decode.
+            if contents is not None:
+                future = self.__pool().submit(self.__decode, contents,
+                                              self.__diskcache_filename(filename, ".pixels"))
+
+            else:
+                future = self.__submit(filename, True, True)
+                if not future:
+                    return False
+
+            self.__decoding.append({"filename": filename, "future": future, "callback": callback})
+
+        self.driftwood.tick.register(self.__image_tick)
+        return True
+
+    def request_audio(self, filename, stream=False):
+        """Retrieve an audio file.
+
+        Sound effects are decoded entirely and kept in a cache limited to audio.cache bytes, dropping the least recently
+        used first. Streamed files such as music are read through a small buffer as they play instead.
+
+        Args:
+            filename: Filename of the audio file.
+            stream: Whether to stream the file rather than decode it as a sound effect.
+
+        Returns:
+            filetype.AudioFile instance, or filetype.MusicFile instance if streamed, or None if failed.
+        """
+        filename = self.driftwood.path.normalize(filename)
+
+        if stream:
+            return self.__request_music(filename)
+
+        if filename in self.__sounds:
+            self.__sounds.move_to_end(filename)
+            return self.__sounds[filename]
+
+        data = self.request(filename, True)
+        if not data:
+            return None
+
+        sound = filetype.AudioFile(data)
+        if not sound.chunk:
+            self.driftwood.log.msg("ERROR", "Resource", "could not decode audio", filename)
+            return None
+
+        self.__sounds[filename] = sound
+        self.__sounds_size += sound.size
+
+        # Drop the least recently used sound effects until we are back under the cap, but always keep this one.
+        while self.__sounds_size > self.driftwood.config["audio"]["cache"] and len(self.__sounds) > 1:
+            oldname, old = self.__sounds.popitem(last=False)
+            self.__sounds_size -= old.size
+            self.driftwood.log.info("Resource", "dropped audio", oldname)
+
+        return sound
+
+    def invalidate(self, filename):
+        """Forget everything held about a file, so that it is read again on the next request.
+
+        Args:
+            filename: Filename of the file to forget.
+        """
+        filename = self.driftwood.path.normalize(filename)
+
+        self.driftwood.cache.purge(filename)
+
+        if filename in self.__sounds:
+            self.__sounds_size -= self.__sounds.pop(filename).size
+
+        if filename in self.__surfaces:
+            SDL_FreeSurface(self.__surfaces.pop(filename))
 
-    def request_audio(self, filename):
-        pass  # TODO
+    def __request_music(self, filename):
+        """Open an audio file for streaming from its pathname.
+        """
+        pathname = self.driftwood.path[filename]
+        if not pathname:
+            self.driftwood.log.msg("ERROR", "Resource", "no such file", filename)
+            return None
+
+        try:
+            kind = self.driftwood.path.kind(pathname)
+
+            # This is a directory.
+            if kind == "dir":
+                source = open(os.path.join(pathname, filename), "rb")
+                size = os.fstat(source.fileno()).st_size
+
+            # This is a resource pack.
+            elif kind == "pack":
+                source = self.driftwood.path.pack(pathname).open(filename)
+                size = source.seek(0, os.SEEK_END)
+                source.seek(0)
+
+            # This is hopefully a zip archive.
+            else:
+                info = self.driftwood.path.zipinfo(filename, pathname)
+                source = self.driftwood.path.archive(pathname).open(info)
+                size = info.file_size
+
+        except:
+            self.driftwood.log.msg("ERROR", "Resource", "could not read file", filename)
+            return None
+
+        music = filetype.MusicFile(source, size, self.driftwood.config["audio"]["buffer"])
+        if not music.music:
+            self.driftwood.log.msg("ERROR", "Resource", "could not decode audio", filename)
+            return None
+
+        self.driftwood.log.info("Resource", "streaming", filename)
+        return music
+
+    def __prefetch_tick(self, millis_past):
+        """Tick callback which hands over completed prefetches and notifies completed batches.
+        """
+        for batch in list(self.__batches):
+            for filename in list(batch["futures"]):
+                future = batch["futures"][filename]
+                if not future.done():
+                    continue
+
+                del batch["futures"][filename]
+
+                # The first batch to see a file completed hands it over.
+                if filename in self.__inflight and self.__inflight[filename] is future:
+                    del self.__inflight[filename]
+                    self.__finish_prefetch(filename, future)
+
+            if not batch["futures"]:
+                self.__batches.remove(batch)
+                self.driftwood.log.info("Resource", "prefetched", "{0} file(s)".format(len(batch["filenames"])))
+                if batch["callback"]:
+                    batch["callback"](batch["filenames"])
+
+        if not self.__batches:
+            self.driftwood.tick.unregister(self.__prefetch_tick)
+
+    def __image_tick(self, millis_past):
+        """Tick callback which collects decoded images and uploads a limited number of them to textures.
+        """
+        for job in list(self.__decoding):
+            if not job["future"].done():
+                continue
+
+            self.__decoding.remove(job)
+
+            try:
+                contents, surface = job["future"].result()
+
+            except:
+                self.driftwood.log.msg("ERROR", "Resource", "could not read file", job["filename"])
+                continue
+
+            self.__upload(job["filename"], contents)
+            self.__uploads.append({"filename": job["filename"], "contents": contents, "surface": surface,
+                                   "callback": job["callback"]})
+
+        budget = self.driftwood.config["resource"]["uploads"]
+        while self.__uploads and budget > 0:
+            job = self.__uploads.pop(0)
+            image = filetype.ImageFile(job["contents"], self.driftwood.window.renderer,
+                                       self.__diskcache_filename(job["filename"], ".pixels"), job["surface"])
+            self.driftwood.log.info("Resource", "uploaded", job["filename"])
+            job["callback"](image)
+            budget -= 1
+
+        if not self.__decoding and not self.__uploads:
+            self.driftwood.tick.unregister(self.__image_tick)
+
+    def __finish_prefetch(self, filename, future):
+        """Hand a completed prefetch over to the cache.
+        """
+        try:
+            contents, surface = future.result()
+
+        except:
+            self.driftwood.log.msg("ERROR", "Resource", "could not read file", filename)
+            return
+
+        self.__upload(filename, contents)
+
+        if surface:
+            if filename in self.__surfaces:
+                SDL_FreeSurface(self.__surfaces[filename])
+            self.__surfaces[filename] = surface
+
+    def __upload(self, filename, contents):
+        """Upload file contents to the cache, unless they are a memory map of a file in a directory.
+
+        Such a map holds its file's descriptor open, so it is only kept for as long as the caller needs it.
+        """
+        if isinstance(contents, memoryview) and self.driftwood.path.kind(self.driftwood.path[filename]) == "dir":
+            return
+
+        self.driftwood.cache.upload(filename, contents)
+
+    def __submit(self, filename, binary, decode):
+        """Submit a file to be read by the worker threads.
+
+        Returns the future of the read, or None if the file does not exist.
+        """
+        pathname = self.driftwood.path[filename]
+        if not pathname:
+            self.driftwood.log.msg("ERROR", "Resource", "no such file", filename)
+            return None
+
+        # Open archives on this thread, the worker threads only read from the pool.
+        kind = self.driftwood.path.kind(pathname)
+        if kind == "pack":
+            self.driftwood.path.pack(pathname)
+        elif kind == "zip":
+            self.driftwood.path.archive(pathname)
+            if binary:
+                self.driftwood.path.archive_map(pathname)
+
+        pixelcache = None
+        if decode:
+            pixelcache = self.__diskcache_filename(filename, ".pixels")
+
+        return self.__pool().submit(self.__work, filename, pathname, binary, decode, pixelcache)
+
+    def __pool(self):
+        """Return the worker thread pool, creating it if necessary.
+        """
+        if not self.__executor:
+            workers = None
+            if "resource" in self.driftwood.config and self.driftwood.config["resource"]["workers"]:
+                workers = self.driftwood.config["resource"]["workers"]
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        return self.__executor
+
+    def __work(self, filename, pathname, binary, decode, pixelcache):
+        """Read and optionally decode a file. This runs on a worker thread.
+
+        Returns a tuple of the contents and the decoded SDL_Surface, if any.
+        """
+        contents = self.__read(filename, pathname, binary)
+
+        if decode:
+            return self.__decode(contents, pixelcache)
+
+        return contents, None
+
+    def __decode(self, contents, pixelcache):
+        """Decode image contents and store them in the on-disk cache, if enabled. This runs on a worker thread.
+
+        Images already in the on-disk cache are not decoded, they are mapped in from there when uploaded.
+
+        Returns a tuple of the contents and the decoded SDL_Surface, if any.
+        """
+        if pixelcache and os.path.isfile(pixelcache):
+            return contents, None
+
+        surface = None
+        if contents:
+            surface = filetype.decode_image(contents) or None
+            if surface and pixelcache:
+                surface = filetype.save_pixelcache(surface, pixelcache)
+
+        return contents, surface
+
+    def __read(self, filename, pathname, binary):
+        """Read a file from a pathname. This is safe to call from worker threads once the pathname's archive is open.
+
+        Raises an exception on failure.
+        """
+        kind = self.driftwood.path.kind(pathname)
+
+        # This is a directory.
+        if kind == "dir":
+            if binary:
+                with open(os.path.join(pathname, filename), "rb") as f:
+                    return self.__map_file(f)
+            else:
+                with open(os.path.join(pathname, filename)) as f:
+                    return f.read()
+
+        # This is a resource pack. Stored members come back as views into its memory map.
+        if kind == "pack":
+            contents = self.driftwood.path.pack(pathname).read(filename)
+            if not binary:
+                contents = bytes(contents)
+            return contents
+
+        # This is hopefully a zip archive.
+        info = self.driftwood.path.zipinfo(filename, pathname)
+        contents = None
+        if binary:
+            contents = self.__map_stored_member(info, pathname)
+        if contents is None:
+            contents = self.driftwood.path.archive(pathname).read(info)
+        return contents
+
+    def __map_file(self, f):
+        """Return a memoryview of a private memory map of an open binary file, or read it if it cannot be mapped.
+        """
+        try:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+        except (OSError, ValueError):
+            # Empty files and special files cannot be mapped.
+            return f.read()
+
+    def __map_stored_member(self, info, pathname):
+        """Return a memoryview of an uncompressed zip member inside the archive's memory map.
+
+        Returns None if the member is compressed or encrypted, or if its local header cannot be read.
+        """
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            return None
+
+        mm = self.driftwood.path.archive_map(pathname)
+        if not mm:
+            return None
+
+        # The local header's extra field may differ from the central directory's, so read its lengths from there.
+        header = ZIP_LOCAL_HEADER.unpack_from(mm, info.header_offset)
+        if header[0] != ZIP_LOCAL_SIGNATURE:
+            return None
+        start = info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1]
+
+        if start + info.file_size > len(mm):
+            return None
+
+        return memoryview(mm)[start:start + info.file_size]
+
+    def __diskcache_filename(self, filename, ext):
+        """Return the on-disk cache filename for a file, or None if the on-disk cache is disabled or the file is gone.
+
+        The name is derived from where the file is found and the size and modification time of the file, or of the
+        archive it is in, so the source does not have to be hashed and a changed source gets a new name.
+        """
+        if not self.__diskcache:
+            return None
+
+        pathname = self.driftwood.path[filename]
+        if not pathname:
+            return None
+
+        source = pathname
+        if self.driftwood.path.kind(pathname) == "dir":
+            source = os.path.join(pathname, filename)
+
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+
+        key = "{0}\0{1}\0{2}\0{3}".format(os.path.abspath(source), filename, st.st_size, st.st_mtime_ns)
+        return os.path.join(self.__diskcache, hashlib.sha1(key.encode()).hexdigest() + ext)
+
+    def __diskcache_write(self, cachefile, contents):
+        """Write contents to the on-disk cache, replacing the file atomically.
+        """
+        tmpname = cachefile + ".tmp"
+        try:
+            with open(tmpname, "wb") as f:
+                f.write(contents)
+            os.replace(tmpname, cachefile)
+        except OSError:
+            self.driftwood.log.info("Resource", "could not write to disk cache", cachefile)
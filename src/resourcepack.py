@@ -0,0 +1,383 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## resourcepack.py               ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+import argparse
+import importlib.util
+import io
+import marshal
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+# Pack header: magic, format version, flags, entry count, index offset, names offset.
+PACK_HEADER = struct.Struct("<4sHHIQQ4x")
+PACK_MAGIC = b"DWPK"
+PACK_VERSION = 1
+
+# Index entry: name hash, name offset, name length, compression, data offset, stored size, original size, CRC-32.
+PACK_ENTRY = struct.Struct("<QIHBxQQQI4x")
+
+# Member data starts on page boundaries so it can be mapped and handed out without copying.
+PAGE_SIZE = 4096
+
+# Compression methods.
+STORED = 0
+DEFLATED = 1
+
+# Flags word of a hash-based bytecode file whose source hash should be checked, as in PEP 552.
+BYTECODE_FLAGS = struct.Struct("<I")
+BYTECODE_CHECKED = 0b11
+
+
+def compile_bytecode(source, origin):
+    """Compile a script's source to the contents of a hash-based bytecode file.
+
+    Args:
+        source: Source of the script as bytes.
+        origin: Filename to report in tracebacks.
+
+    Returns: Contents of the bytecode file as bytes.
+    """
+    code = compile(source, origin, "exec", dont_inherit=True)
+    return (importlib.util.MAGIC_NUMBER + BYTECODE_FLAGS.pack(BYTECODE_CHECKED) +
+            importlib.util.source_hash(source) + marshal.dumps(code))
+
+
+def load_bytecode(data, source):
+    """Load a code object from the contents of a hash-based bytecode file.
+
+    Args:
+        data: Contents of the bytecode file.
+        source: Source of the script as bytes, to check the bytecode against.
+
+    Returns: Code object if the bytecode matches this interpreter and source, None otherwise.
+    """
+    magic = importlib.util.MAGIC_NUMBER
+    if len(data) < 16 or data[:4] != magic or BYTECODE_FLAGS.unpack_from(data, 4)[0] != BYTECODE_CHECKED:
+        return None
+    if data[8:16] != importlib.util.source_hash(source):
+        return None
+    try:
+        return marshal.loads(data[16:])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def name_hash(name):
+    """Compute the 64-bit FNV-1a hash of a member name, used to order and search the index.
+
+    Args:
+        name: Member name.
+
+    Returns: A 64-bit integer hash.
+    """
+    h = 0xcbf29ce484222325
+    for byte in name.encode():
+        h = ((h ^ byte) * 0x100000001b3) & 0xffffffffffffffff
+    return h
+
+
+def ispack(filename):
+    """Check whether a file is a Driftwood resource pack.
+
+    Args:
+        filename: Filename of the file to check.
+
+    Returns: True if the file starts with the pack magic, False otherwise.
+    """
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(PACK_MAGIC)) == PACK_MAGIC
+    except OSError:
+        return False
+
+
+class ResourcePack:
+    """This class represents and abstracts a Driftwood resource pack.
+
+    A pack is a fixed header, page-aligned member data stored raw or deflated per member, a block of member names, and
+    an index of fixed-size entries sorted by name hash. The whole pack is memory mapped, and lookups binary search the
+    index in place without loading it.
+
+    Attributes:
+        filename: Filename of the pack.
+        count: Number of members in the pack.
+    """
+
+    def __init__(self, filename):
+        """ResourcePack class initializer.
+
+        Raises an exception if the file is not a valid pack.
+
+        Args:
+            filename: Filename of the pack.
+        """
+        self.filename = filename
+
+        with open(filename, "rb") as f:
+            # A private mapping is writable for ctypes without copying the pack into memory.
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, version, flags, self.count, self.__index, self.__names = PACK_HEADER.unpack_from(self.__mmap)
+
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError("not a version {0} resource pack: {1}".format(PACK_VERSION, filename))
+
+        if self.__index + self.count * PACK_ENTRY.size > len(self.__mmap):
+            raise ValueError("truncated resource pack: {0}".format(filename))
+
+    def __contains__(self, item):
+        if self.__find(item) is not None:
+            return True
+        return False
+
+    def namelist(self):
+        """List the members of the pack.
+
+        Returns: List of member names in index order.
+        """
+        names = []
+        for n in range(self.count):
+            names.append(self.__name(PACK_ENTRY.unpack_from(self.__mmap, self.__index + n * PACK_ENTRY.size)))
+        return names
+
+    def read(self, name):
+        """Read a member of the pack.
+
+        Stored members are returned as a memoryview into the pack's memory map, deflated members are decompressed.
+
+        Args:
+            name: Member name.
+
+        Returns: Contents of the member.
+        """
+        entry = self.__find(name)
+        if entry is None:
+            raise KeyError(name)
+
+        ehash, noffset, nlength, compression, offset, stored, size, crc = entry
+        data = memoryview(self.__mmap)[offset:offset + stored]
+
+        if compression == DEFLATED:
+            return zlib.decompress(data, zlib.MAX_WBITS, size)
+
+        return data
+
+    def open(self, name):
+        """Open a member of the pack as a seekable binary file-like object.
+
+        Stored members are read straight out of the pack's memory map, deflated members are decompressed first.
+
+        Args:
+            name: Member name.
+
+        Returns: File-like object for the member.
+        """
+        data = self.read(name)
+
+        if isinstance(data, memoryview):
+            return io.BufferedReader(MemberReader(data))
+
+        return io.BytesIO(data)
+
+    def close(self):
+        """Drop the pack's memory map.
+
+        The map is not closed explicitly because buffers into it may still be held elsewhere. It is closed once the
+        last such buffer is released.
+        """
+        self.__mmap = None
+
+    def __find(self, name):
+        """Binary search the index for a member, returning its entry tuple or None.
+        """
+        target = name_hash(name)
+        lo, hi = 0, self.count
+
+        # Find the first entry with the target hash.
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if PACK_ENTRY.unpack_from(self.__mmap, self.__index + mid * PACK_ENTRY.size)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # Check each entry with the target hash, in case of collisions.
+        while lo < self.count:
+            entry = PACK_ENTRY.unpack_from(self.__mmap, self.__index + lo * PACK_ENTRY.size)
+            if entry[0] != target:
+                break
+            if self.__name(entry) == name:
+                return entry
+            lo += 1
+
+        return None
+
+    def __name(self, entry):
+        return bytes(self.__mmap[self.__names + entry[1]:self.__names + entry[1] + entry[2]]).decode()
+
+
+class MemberReader(io.RawIOBase):
+    """This class reads a stored pack member from its memoryview without copying the whole member.
+    """
+
+    def __init__(self, view):
+        """MemberReader class initializer.
+
+        Args:
+            view: memoryview of the member's data.
+        """
+        self.__view = view
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.__view) - self.__pos))
+        b[:n] = self.__view[self.__pos:self.__pos + n]
+        self.__pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.__pos
+        elif whence == io.SEEK_END:
+            offset += len(self.__view)
+
+        if offset < 0:
+            raise ValueError("negative seek position")
+
+        self.__pos = offset
+        return self.__pos
+
+    def tell(self):
+        return self.__pos
+
+
+def build(datadir, packfile, compress=True, bytecode=False, skipped=None):
+    """Build a resource pack from the contents of a data directory.
+
+    Members are deflated if compress is set and deflating saves at least a tenth of their size, otherwise they are
+    stored raw. If bytecode is set, each script is precompiled for the running interpreter and packed next to its
+    source as a ".pyc" member, which ScriptManager loads instead of compiling as long as the source still matches.
+
+    Args:
+        datadir: Directory whose files to pack. Member names are their paths relative to it, with '/' separators.
+        packfile: Filename of the pack to write.
+        compress: (optional) Whether to deflate members where worthwhile.
+        bytecode: (optional) Whether to precompile scripts.
+        skipped: (optional) List to append the names of scripts which could not be precompiled to.
+
+    Returns: Number of members packed.
+    """
+    filenames = []
+    for root, dirs, files in os.walk(datadir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filenames.append((os.path.relpath(path, datadir).replace(os.sep, '/'), path))
+
+    present = set(name for name, path in filenames)
+    if bytecode:
+        filenames += [(name + "c", None) for name, path in filenames
+                      if name.endswith(".py") and name + "c" not in present]
+
+    entries = []
+    names = b""
+
+    with open(packfile + ".tmp", "wb") as f:
+        f.write(bytes(PACK_HEADER.size))
+
+        for name, path in filenames:
+            if path:
+                with open(path, "rb") as src:
+                    data = src.read()
+            else:
+                try:
+                    with open(os.path.join(datadir, name[:-1]), "rb") as src:
+                        data = compile_bytecode(src.read(), name[:-1])
+                except SyntaxError:
+                    if skipped is not None:
+                        skipped.append(name[:-1])
+                    continue
+
+            compression = STORED
+            stored = data
+            if compress and data:
+                deflated = zlib.compress(data, 9)
+                if len(deflated) <= len(data) * 0.9:
+                    compression = DEFLATED
+                    stored = deflated
+
+            # Align the member to the next page.
+            offset = -(-f.tell() // PAGE_SIZE) * PAGE_SIZE
+            f.write(bytes(offset - f.tell()))
+            f.write(stored)
+
+            bname = name.encode()
+            entries.append((name_hash(name), len(names), len(bname), compression, offset, len(stored), len(data),
+                            zlib.crc32(data)))
+            names += bname
+
+        names_offset = f.tell()
+        f.write(names)
+
+        index_offset = f.tell()
+        for entry in sorted(entries):
+            f.write(PACK_ENTRY.pack(*entry))
+
+        f.seek(0)
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, len(entries), index_offset, names_offset))
+
+    os.replace(packfile + ".tmp", packfile)
+
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a Driftwood 2D resource pack from a data directory.")
+    parser.add_argument("datadir", type=str, help="directory to pack")
+    parser.add_argument("packfile", type=str, help="resource pack to write")
+    parser.add_argument("--store", action="store_true", dest="store", help="store all members without compression")
+    parser.add_argument("--compile", action="store_true", dest="compile", help="precompile scripts to bytecode")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.datadir):
+        print("resourcepack: not a directory: {0}".format(args.datadir))
+        sys.exit(1)  # Fail.
+
+    skipped = []
+    count = build(args.datadir, args.packfile, not args.store, args.compile, skipped)
+    for name in skipped:
+        print("resourcepack: not precompiling broken script: {0}".format(name))
+    print("resourcepack: packed {0} file(s) into {1}".format(count, args.packfile))
@@ -24,18 +24,34 @@
 ## IN THE SOFTWARE.
 ## **********
 
-import imp
+import hashlib
+import importlib.util
+import json
+import marshal
 import os
 import sys
+import time
 import traceback
-import zipimport
 
+from sdl2 import SDL_GetTicks
+
+import resourcepack
 
 class ScriptManager:
     """The Script Manager
 
     This class handles loading scripts and calling their functions. It defines its own method for retrieving the
-    script file (independant of ResourceManager) and internally caches it forever.
+    script file (independant of ResourceManager) and internally caches it forever. Loaded scripts are registered in
+    sys.modules under their base name, as imports would, so they can import each other.
+
+    Compiled scripts are kept in an on-disk bytecode cache if config["script"]["bytecode"] names a directory, keyed by
+    the source and the interpreter, so launches after the first skip compiling. Resource packs built with bytecode
+    carry it alongside each script and need no cache.
+
+    If config["script"]["profile"] is set, or config["script"]["budget"] is a number of milliseconds, the wall time of
+    every script call is measured and kept per "filename:function". Calls which take longer than the budget are
+    reported, and if config["script"]["defer"] is set, calls made after the scripts have used up the budget within a
+    tick are put off until the next tick.
 
     Attributes:
         driftwood: Base class instance.
@@ -52,15 +68,45 @@ class ScriptManager:
         # Dictionary of module instances mapped by filename.
         self.__modules = {}
 
-    def __convert_path(self, filename):
-        """Get around a documented zipimport flaw.
+        # Dictionary of dictionaries of ScriptHook instances, mapped by filename and then by function name.
+        self.__hooks = {}
 
-        Args:
-            filename: The filename to fix.
-        """
-        cpath = list(os.path.split(filename))
-        cpath[-1] = os.path.splitext(cpath[-1])[0]
-        return os.sep.join(cpath)[1:]
+        # Directory of the on-disk bytecode cache, if any.
+        self.__bytecache = None
+        if "script" in self.driftwood.config and self.driftwood.config["script"]["bytecode"]:
+            self.__bytecache = self.driftwood.config["script"]["bytecode"]
+            try:
+                os.makedirs(self.__bytecache, exist_ok=True)
+            except OSError:
+                self.driftwood.log.info("Script", "could not create bytecode cache", self.__bytecache)
+                self.__bytecache = None
+
+        # Whether script calls are being measured. Read by ScriptHook.
+        self._profiling = False
+
+        # Per-tick time budget in milliseconds for script calls, and whether to defer calls past it.
+        self.__budget = 0
+        self.__defer = False
+
+        # Milliseconds used by script calls so far this tick, and the (hook, arg) tuples of calls put off until the
+        # next tick.
+        self.__tick_millis = 0.0
+        self.__deferred = []
+
+        # Dictionary of call statistics dictionaries mapped by "filename:function".
+        self.__stats = {}
+
+        if "script" in self.driftwood.config:
+            config = self.driftwood.config["script"]
+            if "budget" in config and config["budget"]:
+                self.__budget = config["budget"]
+                self.__defer = "defer" in config and config["defer"]
+            self._profiling = bool(self.__budget or ("profile" in config and config["profile"]))
+
+            if self._profiling:
+                self.driftwood.tick.register(self.__tick)
+                if "metrics" in config and config["metrics"]:
+                    self.driftwood.tick.register(self.__write_metrics, delay=1000)
 
     def __load(self, filename):
         """Load a script.
@@ -72,16 +118,20 @@ class ScriptManager:
 
         if importpath:
             try:
-                # This is a directory.
-                if os.path.isdir(importpath):
-                    mname = os.path.splitext(os.path.split(filename)[-1])[0]
-                    self.__modules[filename] = imp.load_source(mname, os.path.join(importpath, filename))
+                mname = os.path.splitext(os.path.split(filename)[-1])[0]
+                origin = os.path.join(importpath, filename)
+                spec = importlib.util.spec_from_loader(mname, None, origin=origin)
+                module = importlib.util.module_from_spec(spec)
+                module.__file__ = origin
 
-                # This is hopefully a zip archive.
-                else:
-                    importer = zipimport.zipimporter(importpath)
-                    mpath = self.__convert_path(filename)
-                    self.__modules[filename] = importer.load_module(mpath)
+                # Register the module like an import would, so scripts can import each other and pickle their objects.
+                sys.modules[mname] = module
+                try:
+                    exec(self.__code(filename, importpath, origin), module.__dict__)
+                except:
+                    del sys.modules[mname]
+                    raise
+                self.__modules[filename] = module
 
                 self.driftwood.log.info("Script", "loaded", filename)
                 return True
@@ -96,6 +146,57 @@ class ScriptManager:
             self.driftwood.log.msg("ERROR", "Script", "no such script", filename)
             return False
 
+    def __code(self, filename, pathname, origin):
+        """Get the code object of a script, from bytecode if there is any for its current source.
+
+        Raises an exception on failure.
+        """
+        kind = self.driftwood.path.kind(pathname)
+        member = self.driftwood.path.normalize(filename)
+
+        # This is a directory.
+        if kind == "dir":
+            with open(origin, "rb") as f:
+                source = f.read()
+
+        # This is a resource pack, which may carry the script's bytecode.
+        elif kind == "pack":
+            pack = self.driftwood.path.pack(pathname)
+            source = bytes(pack.read(member))
+            if member + "c" in pack:
+                code = resourcepack.load_bytecode(pack.read(member + "c"), source)
+                if code:
+                    return code
+
+        # This is hopefully a zip archive.
+        else:
+            source = self.driftwood.path.archive(pathname).read(self.driftwood.path.zipinfo(member, pathname))
+
+        if not self.__bytecache:
+            return compile(source, origin, "exec", dont_inherit=True)
+
+        key = hashlib.sha1(origin.encode() + b"\0" + source).hexdigest()
+        cachefile = os.path.join(self.__bytecache, "{0}.{1}.pyc".format(key, sys.implementation.cache_tag))
+
+        try:
+            with open(cachefile, "rb") as f:
+                code = resourcepack.load_bytecode(f.read(), source)
+            if code:
+                return code
+        except OSError:
+            pass
+
+        data = resourcepack.compile_bytecode(source, origin)
+        tmpname = cachefile + ".tmp"
+        try:
+            with open(tmpname, "wb") as f:
+                f.write(data)
+            os.replace(tmpname, cachefile)
+        except OSError:
+            self.driftwood.log.info("Script", "could not write to bytecode cache", cachefile)
+
+        return marshal.loads(data[16:])
+
     def call(self, filename, func, arg=None):
         """Call a function from a script, loading if not already loaded.
 
@@ -103,28 +204,143 @@ class ScriptManager:
             filename: Filename of the python script containing the function.
             func: Name of the function to call.
             arg: Pass this argument if not None.
+
+        Returns: The function's return value, or False if it failed.
         """
-        if not filename in self.__modules:
-            res = self.__load(filename)
-            if not res:
-                return
+        return self.hook(filename, func)(arg)
 
-        if filename in self.__modules and hasattr(self.__modules[filename], func):
-            try:
-                self.driftwood.log.info("Script", "called", filename, func + "()")
-                if arg:
-                    getattr(self.__modules[filename], func)(arg)
-                else:
-                    getattr(self.__modules[filename], func)()
+    def hook(self, filename, func, arg=None):
+        """Retrieve a reusable handle to a script function.
 
-            except:
-                self.driftwood.log.msg("ERROR", "Script", "broken function", filename, func + "()")
-                traceback.print_exc(0, sys.stdout)
-                sys.stdout.flush()
-                return False
+        The handle resolves the function on its first call and calls it directly from then on, until the script is
+        unloaded. Maps and entities resolve their event hooks to handles once when they are loaded, rather than looking
+        the function up on every event.
 
-        else:
-            self.driftwood.log.msg("ERROR", "Script", "no such function", filename, func + "()")
+        Args:
+            filename: Filename of the python script containing the function.
+            func: Name of the function.
+            arg: (optional) Argument to pass when the handle is called without one.
+
+        Returns: ScriptHook instance.
+        """
+        if filename not in self.__hooks:
+            self.__hooks[filename] = {}
+        if (func, arg) not in self.__hooks[filename]:
+            self.__hooks[filename][func, arg] = ScriptHook(self, filename, func, arg)
+        return self.__hooks[filename][func, arg]
+
+    def event(self, value):
+        """Retrieve a reusable handle for an event property.
+
+        Args:
+            value: Event property of the form "filename:function" or "filename:function:argument".
+
+        Returns: ScriptHook instance.
+        """
+        return self.hook(*value.split(':', 2))
+
+    def unload(self, filename):
+        """Unload a script so that it is loaded again from its file on next use.
+
+        Handles to the script's functions stay valid, and resolve the functions again on their next call.
+
+        Args:
+            filename: Filename of the python script to unload.
+        """
+        if filename in self.__hooks:
+            for hook in self.__hooks[filename].values():
+                hook._invalidate()
+
+        if filename in self.__modules:
+            del self.__modules[filename]
+            self.driftwood.log.info("Script", "unloaded", filename)
+
+    def stats(self, name=None):
+        """Retrieve script call statistics. These are only collected while profiling.
+
+        Each statistics dictionary holds the number of "calls", their total and longest wall time in "millis" and
+        "max", the number of calls "over" the budget, and the number of calls "deferred" to a later tick.
+
+        Args:
+            name: (optional) Only return the statistics of this "filename:function".
+
+        Returns: Dictionary of statistics if name is set, otherwise a dictionary of statistics dictionaries mapped by
+            "filename:function".
+        """
+        if name is not None:
+            if name in self.__stats:
+                return dict(self.__stats[name])
+            return self.__new_stats()
+
+        return {name: dict(self.__stats[name]) for name in self.__stats}
+
+    def write_stats(self, filename):
+        """Write the script call statistics to a JSON metrics file.
+
+        Args:
+            filename: Filename of the metrics file to write.
+
+        Returns: True if succeeded, False if failed.
+        """
+        try:
+            with open(filename, 'w') as f:
+                json.dump({"ticks": SDL_GetTicks(), "stats": self.stats()}, f, indent=4, sort_keys=True)
+
+        except:
+            self.driftwood.log.msg("ERROR", "Script", "could not write metrics file", filename)
+            return False
+
+        return True
+
+    def _profiled_call(self, hook, target, arg):
+        """Call a resolved script function on behalf of a ScriptHook, measuring it against the budget.
+
+        Returns: The function's return value, False if it failed, or None if it was deferred.
+        """
+        name = hook.filename + ':' + hook.func
+        if name not in self.__stats:
+            self.__stats[name] = self.__new_stats()
+        stats = self.__stats[name]
+
+        # The budget for this tick is used up, so try again next tick.
+        if self.__defer and self.__tick_millis >= self.__budget:
+            self.__deferred.append((hook, arg))
+            stats["deferred"] += 1
+            self.driftwood.log.info("Script", "deferred", hook.filename, hook.func + "()")
+            return None
+
+        start = time.perf_counter()
+        ret = hook._run(target, arg)
+        millis = (time.perf_counter() - start) * 1000
+
+        self.__tick_millis += millis
+        stats["calls"] += 1
+        stats["millis"] += millis
+        if millis > stats["max"]:
+            stats["max"] = millis
+
+        if self.__budget and millis > self.__budget:
+            stats["over"] += 1
+            self.driftwood.log.warn("WARNING", "Script", "over budget", hook.filename, hook.func + "()",
+                                    "{0:.2f} ms".format(millis))
+
+        return ret
+
+    def __tick(self, millis_past):
+        """Start a new tick's budget, and make the calls deferred from the last tick.
+        """
+        self.__tick_millis = 0.0
+
+        deferred = self.__deferred
+        self.__deferred = []
+        for hook, arg in deferred:
+            hook(arg)
+
+    def __write_metrics(self, millis_past):
+        self.write_stats(self.driftwood.config["script"]["metrics"])
+
+    def __new_stats(self):
+        return {"calls": 0, "millis": 0.0, "max": 0.0, "over": 0, "deferred": 0}
 
     def module(self, filename):
         """Return the module instance of a script, loading if not already loaded.
@@ -139,3 +355,88 @@ class ScriptManager:
 
         if filename in self.__modules:
             return self.__modules[filename]
+
+
+class ScriptHook:
+    """This class is a handle to a function in a script, returned by ScriptManager.hook().
+
+    Calling the handle calls the function, loading the script if it is not already loaded.
+
+    Attributes:
+        manager: Parent ScriptManager instance.
+
+        filename: Filename of the python script containing the function.
+        func: Name of the function.
+        arg: Argument passed when the handle is called without one, or None.
+    """
+
+    def __init__(self, scriptmanager, filename, func, arg=None):
+        """ScriptHook class initializer.
+
+        Args:
+            scriptmanager: Link back to the parent ScriptManager instance.
+            filename: Filename of the python script containing the function.
+            func: Name of the function.
+            arg: (optional) Argument to pass when the handle is called without one.
+        """
+        self.manager = scriptmanager
+
+        self.filename = filename
+        self.func = func
+        self.arg = arg
+
+        # The resolved function, or None until the next call resolves it.
+        self.__target = None
+
+    def __call__(self, arg=None):
+        """Call the function.
+
+        Args:
+            arg: Pass this argument if not None, otherwise pass the handle's own argument if it has one.
+
+        Returns: The function's return value, False if it failed, or None if it was deferred to the next tick.
+        """
+        if arg is None:
+            arg = self.arg
+
+        target = self.__target or self.__resolve()
+        if not target:
+            return False
+
+        if self.manager._profiling:
+            return self.manager._profiled_call(self, target, arg)
+
+        return self._run(target, arg)
+
+    def _run(self, target, arg):
+        """Call the resolved function, reporting any exception.
+        """
+        try:
+            self.manager.driftwood.log.info("Script", "called", self.filename, self.func + "()")
+            if arg is not None:
+                return target(arg)
+            else:
+                return target()
+
+        except:
+            self.manager.driftwood.log.msg("ERROR", "Script", "broken function", self.filename, self.func + "()")
+            traceback.print_exc(0, sys.stdout)
+            sys.stdout.flush()
+            return False
+
+    def _invalidate(self):
+        """Forget the resolved function, because its script was unloaded.
+        """
+        self.__target = None
+
+    def __resolve(self):
+        module = self.manager.module(self.filename)
+        if not module:
+            return None
+
+        if not hasattr(module, self.func):
+            self.manager.driftwood.log.msg("ERROR", "Script", "no such function", self.filename, self.func + "()")
+            return None
+
+        self.__target = getattr(module, self.func)
+        return self.__target
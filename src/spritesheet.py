@@ -58,6 +58,11 @@ class Spritesheet:
 
         self.__prepare_spritesheet()
 
+    def reload(self):
+        """Read the sprite sheet image again, after it has changed.
+        """
+        self.__prepare_spritesheet()
+
     def __prepare_spritesheet(self):
         self.image = self.__resource.request_image(self.filename)
         self.texture = self.image.texture
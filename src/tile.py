@@ -40,6 +40,7 @@ class Tile:
         pos: A two-member list containing the x and y coordinates of the tile's position in the map.
         dstrect: A four-member list containing an x,y,w,h destination rectangle for the tile's placement.
         properties: A dictionary containing tile properties.
+        hooks: A dictionary of ScriptHook instances for the tile's script events, mapped by event name.
 
         nowalk: If true, the tile is not walkable.
         exits: A dictionary of exit types ("exit", "exit:up", "exit:down", "exit:left", "exit:right"], with those
@@ -68,8 +69,9 @@ class Tile:
         ]
         self.dstrect = None
         self.properties = {}
+        self.hooks = {}
 
-        self.nowalk = None
+        self.__nowalk = None
         self.exits = {}
 
         # Real tile.
@@ -97,6 +99,19 @@ class Tile:
             if self.afps:
                 self.layer.tilemap.area.driftwood.tick.register(self.__next_member, delay=(1000//self.afps))
 
+    @property
+    def nowalk(self):
+        return self.__nowalk
+
+    @nowalk.setter
+    def nowalk(self, value):
+        self.__nowalk = value
+
+        # Keep the layer's cached walkability grid in step, once the layer is part of the map.
+        tilemap = self.layer.tilemap
+        if self.layer in tilemap.layers:
+            tilemap.area.pathfinder.invalidate(tilemap.layers.index(self.layer))
+
     def srcrect(self):
         """Return an (x, y, w, h) srcrect for the current graphic frame of the tile.
         """
@@ -39,9 +39,11 @@ class Tilemap:
         tilewidth: Width of tiles in the map.
         tileheight: Height of tiles in the map.
         properties: A dictionary containing map properties.
+        hooks: A dictionary of ScriptHook instances for the map's script events, mapped by event name.
 
         layers: The list of Layer class instances for each layer.
         tilesets: The list of Tileset class instances for each tileset.
+        spawned: The list of eids of the entities spawned from the map's object layers.
     """
 
     def __init__(self, area):
@@ -58,9 +60,11 @@ class Tilemap:
         self.tilewidth = 0
         self.tileheight = 0
         self.properties = {}
+        self.hooks = {}
 
         self.layers = []
         self.tilesets = []
+        self.spawned = []
 
         # This contains the JSON of the Tiled map.
         self.__tilemap = {}
@@ -79,6 +83,7 @@ class Tilemap:
             self.layers = []
         if self.tilesets:
             self.tilesets = []
+        self.spawned = []
 
         # Load the JSON data.
         self.__tilemap = data
@@ -90,10 +95,11 @@ class Tilemap:
         self.tileheight = self.__tilemap["tileheight"]
         if "properties" in self.__tilemap:
             self.properties = self.__tilemap["properties"]
+        self.hooks = self._hooks(self.properties, ["on_enter", "on_exit"])
 
         # Call the on_enter event if set.
-        if "on_enter" in self.properties:
-            self.area.driftwood.script.call(*self.properties["on_enter"].split(':'))
+        if "on_enter" in self.hooks:
+            self.hooks["on_enter"]()
 
         # Set the window title.
         if "title" in self.properties:
@@ -106,6 +112,9 @@ class Tilemap:
         # Global object layer.
         gobjlayer = {}
 
+        # Lists of (layer, x, y) positions of the entities to spawn, mapped by descriptor filename.
+        spawns = {}
+
         # Build the tile and layer abstractions.
         for zpos, l in enumerate(self.__tilemap["layers"]):
             # This layer is marked invisible, skip it.
@@ -123,9 +132,46 @@ class Tilemap:
                     gobjlayer = l
 
                 else:
-                    self.layers[-1]._process_objects(l)
+                    for filename, x, y in self.layers[-1]._process_objects(l):
+                        if filename not in spawns:
+                            spawns[filename] = []
+                        spawns[filename].append((len(self.layers) - 1, x, y))
 
-        # Merge the global object layer into all tile layers.
+        # Merge the global object layer into all tile layers. Its entities are only spawned once, on the bottom layer.
         if gobjlayer:
-            for l in self.layers:
-                l._process_objects(gobjlayer)
+            for n, l in enumerate(self.layers):
+                found = l._process_objects(gobjlayer)
+                if n == 0:
+                    for filename, x, y in found:
+                        if filename not in spawns:
+                            spawns[filename] = []
+                        spawns[filename].append((0, x, y))
+
+        # Resolve the layer and tile script events now that all of their properties are known.
+        for l in self.layers:
+            l.hooks = self._hooks(l.properties, ["on_layer"])
+            for t in l.tiles:
+                if "on_tile" in t.properties:
+                    t.hooks = self._hooks(t.properties, ["on_tile"])
+
+        # Spawn the entities from the object layers, all of those from the same descriptor at once.
+        for filename, positions in spawns.items():
+            for ent in self.area.driftwood.entity.insert_many(filename, positions):
+                self.spawned.append(ent.eid)
+
+    def _hooks(self, properties, events):
+        """Build a dispatch table of script hooks from the "filename:function" event properties which are present.
+
+        Args:
+            properties: Dictionary of properties to look for events in.
+            events: List of event names to look for.
+
+        Returns: Dictionary of ScriptHook instances mapped by event name.
+        """
+        hooks = {}
+
+        for event in events:
+            if event in properties:
+                hooks[event] = self.area.driftwood.script.event(properties[event])
+
+        return hooks
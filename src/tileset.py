@@ -33,8 +33,8 @@ class Tileset:
 
         filename: Filename of the tileset image.
         name: Name of the tileset, if any.
-        image: The filetype.ImageFile instance for the tileset image.
-        texture: The SDL_Texture for the tileset image.
+        image: The filetype.ImageFile instance for the tileset image, or None until it has loaded.
+        texture: The SDL_Texture for the tileset image, or None until it has loaded.
         width: Width of the tileset in tiles.
         height: Height of the tileset in tiles.
         imagewidth: Width of the tileset in pixels.
@@ -81,8 +81,8 @@ class Tileset:
     def __prepare_tileset(self):
         self.filename = self.__tileset["image"]
         self.name = self.__tileset["name"]
-        self.image = self.tilemap.area.driftwood.resource.request_image(self.filename)  # Ouch
-        self.texture = self.image.texture
+        # The image is decoded off the main loop, the tiles are drawn once its texture arrives.
+        self.tilemap.area.driftwood.resource.request_image_async(self.filename, self.__image_loaded)
         self.imagewidth = self.__tileset["imagewidth"]
         self.imageheight = self.__tileset["imageheight"]
         self.tilewidth = self.__tileset["tilewidth"]
@@ -97,3 +97,8 @@ class Tileset:
         if "tileproperties" in self.__tileset:
             for key in self.__tileset["tileproperties"].keys():
                 self.tileproperties[int(key)] = self.__tileset["tileproperties"][key]
+
+    def __image_loaded(self, image):
+        self.image = image
+        self.texture = self.image.texture
+        self.tilemap.area.changed = True
@@ -0,0 +1,212 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## walkbatch.py                  ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class WalkBatch:
+    """This class moves all walking tile mode entities together in one tick callback.
+
+    The movement state of each walking entity is kept in NumPy arrays, one element per entity, and advanced for all of
+    them at once each tick. Only entities whose pixel position changed are written back, and only entities which
+    reached their next tile go through the per-entity arrival logic, which calls their tile events and decides whether
+    they keep walking. Entities standing still and trying to walk check their way one by one, as before.
+
+    Attributes:
+        manager: Parent EntityManager instance.
+    """
+
+    def __init__(self, entitymanager):
+        """WalkBatch class initializer.
+
+        Args:
+            entitymanager: Link back to the parent EntityManager instance.
+        """
+        self.manager = entitymanager
+
+        # List of the walking entities, in array order, and dictionary of their positions in the arrays by eid.
+        self.__entities = []
+        self.__slots = {}
+
+        # Arrays of velocity, partial movement toward the next tile, speed, pixel position of the current tile, and
+        # last pixel position written back to the entity.
+        self.__vx = None
+        self.__vy = None
+        self.__px = None
+        self.__py = None
+        self.__speed = None
+        self.__bx = None
+        self.__by = None
+        self.__x = None
+        self.__y = None
+
+        self.__grow(64)
+
+    def __contains__(self, ent):
+        return ent.eid in self.__slots
+
+    def add(self, ent):
+        """Start moving an entity with the batch.
+
+        Args:
+            ent: TileModeEntity to move.
+        """
+        if ent.eid in self.__slots:
+            return
+
+        if len(self.__entities) == len(self.__vx):
+            self.__grow(len(self.__vx) * 2)
+
+        self.__slots[ent.eid] = len(self.__entities)
+        self.__entities.append(ent)
+        self.sync(ent)
+
+    def remove(self, ent):
+        """Stop moving an entity with the batch.
+
+        Args:
+            ent: TileModeEntity to stop moving.
+        """
+        if ent.eid not in self.__slots:
+            return
+
+        # Move the last entity into the removed entity's place.
+        i = self.__slots.pop(ent.eid)
+        last = self.__entities.pop()
+        if last is not ent:
+            self.__entities[i] = last
+            self.__slots[last.eid] = i
+            for a in self.__arrays():
+                a[i] = a[len(self.__entities)]
+
+    def sync(self, ent, partial=True):
+        """Load an entity's movement state into the batch after the entity changed it itself.
+
+        The batch does not keep the entities' partial movement up to date between ticks, so it should only be loaded
+        from an entity that has just been given it back.
+
+        Args:
+            ent: TileModeEntity whose state to load.
+            partial: (optional) Whether to load the entity's partial movement, or keep the batch's.
+        """
+        if ent.eid not in self.__slots:
+            return
+
+        i = self.__slots[ent.eid]
+        tilemap = self.manager.driftwood.area.tilemap
+
+        self.__vx[i], self.__vy[i] = ent.velocity
+        if partial:
+            self.__px[i], self.__py[i] = ent._partial_xy
+        self.__speed[i] = ent.speed
+        if ent.tile:
+            self.__bx[i] = ent.tile.pos[0] * tilemap.tilewidth
+            self.__by[i] = ent.tile.pos[1] * tilemap.tileheight
+        else:
+            self.__bx[i] = ent.x - self.__px[i]
+            self.__by[i] = ent.y - self.__py[i]
+        self.__x[i] = ent.x
+        self.__y[i] = ent.y
+
+    def tick(self, millis_past):
+        """Tick callback.
+        """
+        if not self.__entities:
+            return
+
+        # Entities standing still try to start walking.
+        n = len(self.__entities)
+        idle = np.flatnonzero((self.__vx[:n] == 0) & (self.__vy[:n] == 0))
+        for ent in [self.__entities[i] for i in idle]:
+            if ent.eid in self.__slots and ent._start_walk():
+                self.sync(ent)
+
+        n = len(self.__entities)
+        if not n:
+            return
+
+        vx, vy = self.__vx[:n], self.__vy[:n]
+        px, py = self.__px[:n], self.__py[:n]
+
+        # Inch along.
+        step = self.__speed[:n] * (millis_past / 1000)
+        px += vx * step
+        py += vy * step
+        x = (self.__bx[:n] + px).astype(np.int64)
+        y = (self.__by[:n] + py).astype(np.int64)
+
+        # Write back the positions which changed.
+        moved = np.flatnonzero((x != self.__x[:n]) | (y != self.__y[:n]))
+        if moved.size:
+            self.__x[:n] = x
+            self.__y[:n] = y
+            for i, newx, newy in zip(moved.tolist(), x[moved].tolist(), y[moved].tolist()):
+                ent = self.__entities[i]
+                ent.x = newx
+                ent.y = newy
+                self.manager._moved(ent)
+            self.manager.driftwood.area.changed = True
+
+        # Have any arrived at their next tile?
+        tilemap = self.manager.driftwood.area.tilemap
+        arrived = np.flatnonzero(((vx == -1) & (-px >= tilemap.tilewidth)) | ((vx == 1) & (px >= tilemap.tilewidth)) |
+                                 ((vy == -1) & (-py >= tilemap.tileheight)) | ((vy == 1) & (py >= tilemap.tileheight)))
+
+        for ent in [self.__entities[i] for i in arrived]:
+            # An earlier arrival may have removed this entity.
+            if ent.eid not in self.__slots:
+                continue
+
+            i = self.__slots[ent.eid]
+            ent._partial_xy = [float(self.__px[i]), float(self.__py[i])]
+            ent._arrive()
+            self.sync(ent)
+
+    def __arrays(self):
+        return (self.__vx, self.__vy, self.__px, self.__py, self.__speed, self.__bx, self.__by, self.__x, self.__y)
+
+    def __grow(self, capacity):
+        """Reallocate the arrays to hold a number of entities, keeping their contents.
+        """
+        n = len(self.__entities)
+        old = self.__arrays()
+
+        self.__vx = np.zeros(capacity)
+        self.__vy = np.zeros(capacity)
+        self.__px = np.zeros(capacity)
+        self.__py = np.zeros(capacity)
+        self.__speed = np.zeros(capacity)
+        self.__bx = np.zeros(capacity)
+        self.__by = np.zeros(capacity)
+        self.__x = np.zeros(capacity, dtype=np.int64)
+        self.__y = np.zeros(capacity, dtype=np.int64)
+
+        if old[0] is not None:
+            for new, a in zip(self.__arrays(), old):
+                new[:n] = a[:n]
@@ -0,0 +1,298 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## watchmanager.py               ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+# inotify constants from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+
+IN_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+# Fixed part of struct inotify_event: wd, mask, cookie, len.
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class WatchManager:
+    """The Watch Manager
+
+    This class watches the directory pathnames in the path for changed files while developing, and reloads only what
+    depends on them: cache entries, prefetched images, sprite sheets, scripts, entity templates, and the current area if
+    its map or one of its tilesets changed. Zip archives and resource packs are not watched.
+
+    Linux inotify is used when available, otherwise directories are polled for changed modification times.
+
+    Attributes:
+        driftwood: Base class instance.
+        enabled: Whether the watcher is running.
+    """
+
+    def __init__(self, driftwood):
+        """WatchManager class initializer.
+
+        Args:
+            driftwood: Base class instance.
+        """
+        self.driftwood = driftwood
+
+        self.enabled = False
+
+        # Dictionary of watched directory pathnames mapped to polling snapshots, or None when inotify is used.
+        # A snapshot is a dictionary of (mtime, size) tuples mapped by filename.
+        self.__watched = {}
+
+        # Inotify file descriptor and dictionary of (pathname, relative directory) tuples mapped by watch descriptor.
+        self.__inotify = None
+        self.__wds = {}
+
+        if "watch" in self.driftwood.config and self.driftwood.config["watch"]["enabled"]:
+            self.enable()
+
+    def enable(self):
+        """Start watching the directory pathnames in the path.
+        """
+        if self.enabled:
+            return
+
+        if self.driftwood.config["watch"]["inotify"]:
+            self.__inotify = self.__inotify_init()
+
+        self.enabled = True
+        self.driftwood.tick.register(self.tick, delay=self.driftwood.config["watch"]["interval"])
+
+        self.driftwood.log.info("Watch", "enabled", "inotify" if self.__inotify is not None else "polling")
+
+    def disable(self):
+        """Stop watching.
+        """
+        if not self.enabled:
+            return
+
+        self.driftwood.tick.unregister(self.tick)
+
+        if self.__inotify is not None:
+            os.close(self.__inotify)
+            self.__inotify = None
+
+        self.__watched = {}
+        self.__wds = {}
+        self.enabled = False
+
+        self.driftwood.log.info("Watch", "disabled")
+
+    def tick(self, millis_past):
+        """Tick callback.
+        """
+        self.__sync_pathnames()
+
+        if self.__inotify is not None:
+            changed, structural = self.__read_inotify()
+        else:
+            changed, structural = self.__poll()
+
+        if changed or structural:
+            self.__reload(changed, structural)
+
+    def __sync_pathnames(self):
+        """Start and stop watching pathnames as the path changes.
+        """
+        pathnames = [pn for pn in self.driftwood.path.pathnames() if self.driftwood.path.kind(pn) == "dir"]
+
+        for pathname in list(self.__watched):
+            if pathname not in pathnames:
+                self.__unwatch(pathname)
+
+        for pathname in pathnames:
+            if pathname not in self.__watched:
+                self.__watch(pathname)
+
+    def __watch(self, pathname):
+        if self.__inotify is not None:
+            self.__watched[pathname] = None
+            for root, dirs, files in os.walk(pathname):
+                self.__add_watch(pathname, os.path.relpath(root, pathname))
+        else:
+            self.__watched[pathname] = self.__snapshot(pathname)
+
+        self.driftwood.log.info("Watch", "watching", pathname)
+
+    def __unwatch(self, pathname):
+        for wd in [wd for wd in self.__wds if self.__wds[wd][0] == pathname]:
+            self.__libc.inotify_rm_watch(self.__inotify, wd)
+            del self.__wds[wd]
+
+        del self.__watched[pathname]
+
+    def __add_watch(self, pathname, reldir):
+        wd = self.__libc.inotify_add_watch(self.__inotify, os.fsencode(os.path.join(pathname, reldir)),
+                                           IN_WATCH_MASK)
+        if wd >= 0:
+            self.__wds[wd] = (pathname, reldir)
+
+    def __inotify_init(self):
+        """Set up inotify, returning its file descriptor or None if it is unavailable.
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+
+        try:
+            self.__libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self.__libc.inotify_init1(IN_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+
+        if fd < 0:
+            return None
+
+        return fd
+
+    def __read_inotify(self):
+        """Read pending inotify events.
+
+        Returns a tuple of a set of changed (pathname, filename) tuples and whether files were added or removed.
+        """
+        changed = set()
+        structural = False
+
+        while True:
+            try:
+                buf = os.read(self.__inotify, 65536)
+            except BlockingIOError:
+                break
+
+            if not buf:
+                break
+
+            pos = 0
+            while pos < len(buf):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(buf, pos)
+                name = os.fsdecode(buf[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + length].rstrip(b"\0"))
+                pos += INOTIFY_EVENT.size + length
+
+                if wd not in self.__wds:
+                    continue
+
+                pathname, reldir = self.__wds[wd]
+
+                if mask & IN_IGNORED:
+                    del self.__wds[wd]
+                    continue
+
+                if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF):
+                    structural = True
+
+                if mask & IN_ISDIR:
+                    # Watch new subdirectories too.
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self.__add_watch(pathname, os.path.join(reldir, name))
+                    continue
+
+                if name and mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                    changed.add((pathname, self.driftwood.path.normalize(os.path.join(reldir, name))))
+
+        return changed, structural
+
+    def __poll(self):
+        """Compare each watched pathname against its last snapshot.
+
+        Returns a tuple of a set of changed (pathname, filename) tuples and whether files were added or removed.
+        """
+        changed = set()
+        structural = False
+
+        for pathname in self.__watched:
+            old = self.__watched[pathname]
+            new = self.__snapshot(pathname)
+
+            if old.keys() != new.keys():
+                structural = True
+
+            for filename in old.keys() | new.keys():
+                if filename not in old or filename not in new or old[filename] != new[filename]:
+                    changed.add((pathname, filename))
+
+            self.__watched[pathname] = new
+
+        return changed, structural
+
+    def __snapshot(self, pathname):
+        snapshot = {}
+        for root, dirs, files in os.walk(pathname):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                snapshot[self.driftwood.path.normalize(os.path.relpath(os.path.join(root, name), pathname))] = \
+                    (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def __reload(self, changed, structural):
+        """Invalidate and reload whatever depends on the changed files.
+        """
+        # Pick up added and removed files.
+        if structural:
+            self.driftwood.path.rebuild()
+
+        filenames = set()
+        for pathname, filename in changed:
+            # Ignore changes to files shadowed by a later pathname, unless the file just went away.
+            owner = self.driftwood.path.find(filename)
+            if owner is None or owner == pathname:
+                filenames.add(filename)
+
+        refocus = False
+        area = self.driftwood.area
+
+        for filename in sorted(filenames):
+            self.driftwood.log.info("Watch", "changed", filename)
+
+            self.driftwood.resource.invalidate(filename)
+            self.driftwood.script.unload(filename)
+            self.driftwood.entity.invalidate(filename)
+
+            ss = self.driftwood.entity.spritesheet(filename)
+            if ss:
+                ss.reload()
+
+            if area.filename and (filename == area.filename or
+                                  filename in [ts.filename for ts in area.tilemap.tilesets]):
+                refocus = True
+
+        if refocus:
+            area.focus(area.filename)
@@ -31,4 +31,14 @@ sys.path.insert(0, "tests")
 
 # Add all tests here.
 from test_databasemanager import TestDatabaseCreation
+from test_cachemanager import TestCacheStatistics
+from test_entitymanager import TestEntityManager
+from test_filetype import TestStreamBuffer, TestPixelCache, TestAudioFiles
+from test_pathfinder import TestPathfinder
+from test_pathmanager import TestPathManager
+from test_resourcemanager import TestResourceManager
+from test_resourcepack import TestResourcePack
+from test_scriptmanager import TestScriptManager
 from test_tickmanager import TestTickManager
+from test_tilemap import TestTilemap
+from test_watchmanager import TestWatchManager
@@ -0,0 +1,120 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## bench_walkbatch.py            ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+# Benchmark of tile mode walking, with each entity moving itself in its own tick callback versus all of them moving
+# together in a WalkBatch.
+#
+# Usage: PYTHONPATH=../src python3 bench_walkbatch.py [entities] [ticks]
+
+import sys
+import time
+import types
+import unittest.mock as mock
+
+import entitymanager
+import walkbatch
+
+class Ticker:
+    """Stand-in for the TickManager which ticks on demand"""
+    def __init__(self):
+        self.callbacks = []
+
+    def register(self, callback, delay=0, once=False):
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def unregister(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def tick(self, millis_past):
+        for callback in list(self.callbacks):
+            callback(millis_past)
+
+class Layer:
+    """Stand-in for a map layer of walkable tiles"""
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.hooks = {}
+        self.tiles = {}
+
+    def tile(self, x, y):
+        x, y = int(x), int(y)
+        if x < 0 or y < 0 or x >= self.tilemap.width or y >= self.tilemap.height:
+            return None
+        if (x, y) not in self.tiles:
+            self.tiles[x, y] = types.SimpleNamespace(pos=[x, y], nowalk=None, exits={}, hooks={}, properties={})
+        return self.tiles[x, y]
+
+def driftwood(batch, size):
+    d = types.SimpleNamespace()
+    d.config = {'entity': {'cell': 64, 'batch': batch}, 'log': {'verbose': False}}
+    d.log = types.SimpleNamespace(info=lambda *chain: None, msg=lambda *chain: None)
+    d.tick = Ticker()
+    d.resource = types.SimpleNamespace(request_json=lambda filename: {
+        "mode": "tile", "collision": True, "width": 16, "height": 16, "speed": 32, "members": [0], "afps": 0,
+        "image": "npc.png"
+    })
+    tilemap = types.SimpleNamespace(width=size, height=size, tilewidth=16, tileheight=16)
+    tilemap.layers = [Layer(tilemap)]
+    d.area = types.SimpleNamespace(tilemap=tilemap, changed=False)
+    return d
+
+def run(batch, count, ticks):
+    side = int(count ** 0.5) + 1
+    d = driftwood(batch, side * 4)
+    em = entitymanager.EntityManager(d)
+    em.player = types.SimpleNamespace(eid=-1)
+
+    ents = []
+    for n in range(count):
+        ent = em.insert("npc.json", 0, (n % side) * 64, (n // side) * 64)
+        ent.set_next_velocity(1 if n % 2 else 0, 0 if n % 2 else 1)
+        ents.append(ent)
+
+    start = time.perf_counter()
+    for t in range(ticks):
+        # Turn everyone around every second so they stay on the map.
+        if t % 100 == 99:
+            for ent in ents:
+                ent.set_next_velocity(-ent.next_velocity[0], -ent.next_velocity[1])
+        d.tick.tick(10)
+    return (time.perf_counter() - start) * 1000 / ticks
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    spritesheet = lambda manager, filename: types.SimpleNamespace(filename=filename)
+
+    with mock.patch('entity.spritesheet.Spritesheet', spritesheet):
+        print("{0} entities, {1} ticks of 10 ms".format(count, ticks))
+        print("per-entity callbacks: {0:.2f} ms/tick".format(run(False, count, ticks)))
+        if walkbatch.np:
+            print("WalkBatch:            {0:.2f} ms/tick".format(run(True, count, ticks)))
+        else:
+            print("WalkBatch:            NumPy is not available")
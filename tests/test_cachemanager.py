@@ -0,0 +1,95 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_cachemanager.py          ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+import unittest
+import unittest.mock as mock
+
+import cachemanager
+
+def driftwood():
+    """Create a mock, shared Driftwood object"""
+    d = mock.Mock()
+    d.config = {
+        'cache': {
+            'enabled': True,
+            'ttl': 300,
+        }
+    }
+    d.log.msg.side_effect = Exception('log.msg called')
+    return d
+
+class TestCacheStatistics(unittest.TestCase):
+    """Test that the CacheManager keeps accurate statistics.
+    """
+
+    def test_hits_and_misses(self):
+        """Downloads should count as hits when cached and misses when not"""
+        cache = cachemanager.CacheManager(driftwood())
+        cache.upload("a.json", b"12345")
+        cache.download("a.json")
+        cache.download("b.json")
+
+        stats = cache.stats("Resource")
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+        assert stats["bytes"] == 5
+
+    def test_namespaces(self):
+        """Prefixed keys should be counted in their own namespace"""
+        cache = cachemanager.CacheManager(driftwood())
+        cache.upload("DB:key", "value")
+        cache.upload("a.json", b"12")
+
+        assert cache.stats("DB")["bytes"] == 5
+        assert cache.stats("Resource")["bytes"] == 2
+        assert set(cache.stats().keys()) == {"DB", "Resource"}
+
+    def test_evictions_and_expirations(self):
+        """Purges should count as evictions and garbage collection as expirations"""
+        cache = cachemanager.CacheManager(driftwood())
+        with mock.patch('cachemanager.SDL_GetTicks', return_value=0):
+            cache.upload("a.json", b"12")
+            cache.upload("b.json", b"34")
+        cache.purge("a.json")
+        with mock.patch('cachemanager.SDL_GetTicks', return_value=300000):
+            cache.clean(0)
+
+        stats = cache.stats("Resource")
+        assert stats["evictions"] == 1
+        assert stats["expirations"] == 1
+        assert stats["entries"] == 0
+        assert stats["bytes"] == 0
+
+    def test_reupload_replaces_size(self):
+        """Uploading over an existing file should not double count it"""
+        cache = cachemanager.CacheManager(driftwood())
+        cache.upload("a.json", b"12")
+        cache.upload("a.json", b"1234")
+
+        assert cache.stats("Resource")["entries"] == 1
+        assert cache.stats("Resource")["bytes"] == 4
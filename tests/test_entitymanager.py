@@ -0,0 +1,302 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_entitymanager.py         ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import unittest
+import unittest.mock as mock
+
+import entitymanager
+import pathfinder
+import walkbatch
+
+class Ticker:
+    """Stand-in for the TickManager which ticks on demand"""
+    def __init__(self):
+        self.callbacks = []
+
+    def register(self, callback, delay=0, once=False):
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def unregister(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def tick(self, millis_past):
+        for callback in list(self.callbacks):
+            callback(millis_past)
+
+def driftwood(batch=False):
+    """Create a mock, shared Driftwood object with a 100x100 map of 16 pixel tiles"""
+    d = mock.Mock()
+    d.config = {
+        'entity': {
+            'cell': 32,
+            'batch': batch
+        }
+    }
+    d.tick = Ticker()
+    d.log.msg.side_effect = Exception('log.msg called')
+    d.resource.request_json.return_value = {
+        "mode": "tile", "collision": True, "width": 16, "height": 16, "speed": 16, "members": [0], "afps": 0,
+        "image": "npc.png"
+    }
+
+    tilemap = d.area.tilemap
+    tilemap.width = tilemap.height = 100
+    tilemap.tilewidth = tilemap.tileheight = 16
+    tilemap.layers = [mock.Mock(), mock.Mock()]
+    for layer in tilemap.layers:
+        layer.tile.side_effect = lambda x, y: tile(x, y)
+        layer.hooks = {}
+    return d
+
+def tile(x, y):
+    """Create a walkable mock tile"""
+    t = mock.Mock()
+    t.pos = [int(x), int(y)]
+    t.nowalk = None
+    t.exits = {}
+    t.hooks = {}
+    t.properties = {}
+    return t
+
+@mock.patch('entity.spritesheet.Spritesheet', mock.Mock())
+class TestEntityManager(unittest.TestCase):
+    """Test that the EntityManager keeps its spatial hash up to date.
+    """
+
+    def test_nearby(self):
+        """Only entities in the cells around a rectangle should be found"""
+        d = driftwood()
+        em = entitymanager.EntityManager(d)
+        a = em.insert("npc.json", 0, 0, 0)
+        b = em.insert("npc.json", 0, 16, 0)
+        c = em.insert("npc.json", 0, 320, 320)
+        d_ = em.insert("npc.json", 1, 16, 0)
+
+        assert em._nearby(0, 0, 0, 16, 16) == {a, b}
+        assert em._nearby(0, 320, 320, 16, 16) == {c}
+        assert em._nearby(1, 0, 0, 32, 32) == {d_}
+
+        c.teleport(0, 0, 0)
+        assert em._nearby(0, 320, 320, 16, 16) == set()
+        assert em._nearby(0, 0, 0, 16, 16) == {a, b, c}
+
+        em.kill(d_.eid)
+        assert em._nearby(1, 0, 0, 32, 32) == set()
+
+    def test_queries(self):
+        """Rectangle, radius and region queries should find exactly the entities overlapping them"""
+        d = driftwood()
+        em = entitymanager.EntityManager(d)
+        a = em.insert("npc.json", 0, 0, 0)
+        b = em.insert("npc.json", 0, 32, 0)
+        c = em.insert("npc.json", 0, 32, 32)
+        em.insert("npc.json", 1, 0, 0)
+        e = em.insert("npc.json", 0, 1504, 1504)
+
+        assert em.rect(0, 8, 8, 32, 8) == (a, b)
+        assert em.rect(0, 16, 0, 16, 16) == ()
+        assert em.rect(0, 0, 0, 1600, 1600) == (a, b, c, e)
+        assert em.radius(0, 40, 24, 9) == (b, c)
+        assert em.radius(0, 24, 24, 11) == ()
+        assert em.radius(0, 24, 24, 12) == (a, b, c)
+        assert em.region(0, 2, 1, 1, 2) == (c,)
+        assert em.region(2, 0, 0, 100, 100) == ()
+
+    def test_indexes(self):
+        """Entities should be found by eid, layer and filename, and killed without disturbing the others"""
+        d = driftwood()
+        em = entitymanager.EntityManager(d)
+        a = em.insert("npc.json", 0, 0, 0)
+        b = em.insert("npc.json", 0, 16, 0)
+        c = em.insert("player.json", 1, 32, 0)
+
+        assert em.entity(b.eid) is b
+        assert em.layer(0) == (a, b)
+        assert em.layer(1) == (c,)
+        assert em.layer(2) == ()
+
+        a.teleport(1, 0, 0)
+        assert em.layer(0) == (b,)
+        assert em.layer(1) == (c, a)
+
+        em.kill(b.eid)
+        assert em.entity(b.eid) is None
+        assert em.entities == (a, c)
+
+        em.killall("npc.json")
+        assert em.entities == (c,)
+        assert em.layer(1) == (c,)
+
+    def test_insert_many(self):
+        """Bulk insertion should read the descriptor once and call on_insert once per entity"""
+        d = driftwood()
+        d.resource.request_json.return_value["on_insert"] = "npc.py:spawned"
+        d.resource.request_json.return_value["properties"] = {"inventory": ["key"]}
+        d.log.msg.side_effect = None
+        em = entitymanager.EntityManager(d)
+
+        ents = em.insert_many("npc.json", [(0, 16 * n, 0) for n in range(50)] + [(0, 3, 0)])
+        assert len(ents) == 50
+        assert d.log.msg.call_count == 1
+        assert em.insert("npc.json", 1, 0, 0).template is ents[0].template
+        assert d.resource.request_json.call_count == 1
+        assert d.script.event.return_value.call_count == 51
+
+        ents[0].properties["name"] = "Bob"
+        ents[0].properties["inventory"].append("coin")
+        assert "name" not in ents[1].properties
+        assert ents[1].properties["inventory"] == ["key"]
+
+    def test_pool(self):
+        """Killed entities should be reused, and cost no tick callbacks while they wait in the pool"""
+        d = driftwood()
+        d.config['entity']['pool'] = 1
+        d.resource.request_json.return_value["afps"] = 4
+        em = entitymanager.EntityManager(d)
+        callbacks = list(d.tick.callbacks)
+
+        a = em.insert("npc.json", 0, 0, 0)
+        a.set_next_velocity(1, 0)
+        d.tick.tick(10)
+        assert len(d.tick.callbacks) == len(callbacks) + 1
+        eid = a.eid
+
+        em.kill(a.eid)
+        assert d.tick.callbacks == callbacks
+        assert a not in em.animation
+        for t in range(100):
+            d.tick.tick(10)
+        assert a.x == 0
+        assert em.entity(eid) is None
+
+        b = em.insert("npc.json", 0, 32, 32)
+        assert b is a and b.eid != eid
+        assert (b.x, b.y, b.velocity) == (32, 32, (0, 0))
+        assert em.layer(0) == (b,)
+        assert b in em.animation
+        b.set_next_velocity(0, 1)
+        for t in range(10):
+            d.tick.tick(100)
+        assert b.y > 32
+
+    def test_animation(self):
+        """Entities with the same afps should change frames together from one tick callback"""
+        d = driftwood()
+        d.resource.request_json.return_value["afps"] = 4
+        d.resource.request_json.return_value["members"] = [0, 1, 2]
+        em = entitymanager.EntityManager(d)
+        callbacks = list(d.tick.callbacks)
+
+        ents = [em.insert("npc.json", 0, 16 * n, 0) for n in range(10)]
+        assert d.tick.callbacks == callbacks
+
+        d.area.changed = False
+        d.tick.tick(200)
+        assert not d.area.changed
+        d.tick.tick(400)
+        assert d.area.changed
+        assert {ent._Entity__cur_member for ent in ents} == {2}
+
+        em.kill(ents[0].eid)
+        d.tick.tick(250)
+        assert ents[0]._Entity__cur_member == 2
+        assert ents[1]._Entity__cur_member == 0
+
+        fast = em.insert("npc.json", 1, 0, 0)
+        fast.afps = 2000
+        em.animation.add(fast)
+        d.tick.tick(1)
+        assert fast._Entity__cur_member == 1
+
+    def test_entity_collision(self):
+        """Entities should not walk onto each other's tiles"""
+        d = driftwood()
+        em = entitymanager.EntityManager(d)
+        a = em.insert("npc.json", 0, 0, 0)
+        b = em.insert("npc.json", 0, 16, 0)
+
+        assert not a._TileModeEntity__can_walk(1, 0)
+        assert a._TileModeEntity__can_walk(0, 1)
+        assert b._TileModeEntity__can_walk(1, 0)
+
+    def test_pixel_walk(self):
+        """Pixel mode entities should stop against walls and entities however far they move in one call"""
+        d = driftwood()
+        d.resource.request_json.return_value["mode"] = "pixel"
+        for layer in d.area.tilemap.layers:
+            layer.tiles = [mock.Mock(seq=n, nowalk="" if n % 100 == 5 else None) for n in range(100 * 100)]
+        d.area.pathfinder = pathfinder.Pathfinder(d.area)
+        em = entitymanager.EntityManager(d)
+        em.collider = mock.Mock()
+        a = em.insert("npc.json", 0, 0, 0)
+        b = em.insert("npc.json", 0, 0, 48)
+        c = em.insert("npc.json", 0, 48, 48)
+
+        assert not a.walk(100, 3)
+        assert (a.x, a.y) == (64, 3)
+        assert em.collider.call_count == 1
+
+        assert not b.walk(40, 0)
+        assert b.x == 32
+        em.collider.assert_called_with(b, c)
+        assert em._nearby(0, 32, 48, 16, 16) >= {b, c}
+
+        assert not c.walk(-3, 0)
+        assert c.x == 48
+        assert not c.walk(0, 2000)
+        assert c.y == 1584
+
+        assert not a.walk(-200, 0)
+        assert a.x == 0
+        assert a.walk(0, 12)
+        assert a.y == 15
+
+    @unittest.skipUnless(walkbatch.np, "NumPy is not available")
+    def test_walk_batch(self):
+        """Entities moved by the WalkBatch should walk exactly as they do on their own"""
+        positions = []
+
+        for batch in [False, True]:
+            d = driftwood(batch)
+            em = entitymanager.EntityManager(d)
+            assert bool(em.walkbatch) == batch
+
+            ents = [em.insert("npc.json", 0, 32 * n, 32) for n in range(8)]
+            ents[1].speed = 40
+            for n, ent in enumerate(ents):
+                ent.set_next_velocity(0, 1 if n % 2 else -1)
+            ents[2].set_next_velocity(1, 0)
+
+            for t in range(100):
+                d.tick.tick(10)
+                if t == 50:
+                    ents[3].set_next_velocity(0, 0)
+
+            positions.append([(ent.x, ent.y, ent.tile.pos) for ent in ents])
+
+        assert positions[0] == positions[1]
@@ -0,0 +1,140 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_filetype.py              ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import unittest.mock as mock
+import wave
+import zlib
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from sdl2 import SDL_INIT_AUDIO, SDL_InitSubSystem, SDL_QuitSubSystem
+from sdl2 import SDL_CreateRGBSurface, SDL_CreateSoftwareRenderer, SDL_DestroyRenderer, SDL_FreeSurface
+from sdl2.sdlmixer import MIX_DEFAULT_FORMAT, Mix_CloseAudio, Mix_OpenAudio
+
+import filetype
+
+def wav(frames):
+    """Create the contents of a silent 16-bit mono WAV file"""
+    out = io.BytesIO()
+    w = wave.open(out, 'wb')
+    w.setnchannels(1)
+    w.setsampwidth(2)
+    w.setframerate(22050)
+    w.writeframes(bytes(frames * 2))
+    w.close()
+    return out.getvalue()
+
+def png(width, height):
+    """Create the contents of an opaque white 8-bit RGB PNG file"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\0" + b"\xff" * 3 * width for y in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+class TestStreamBuffer(unittest.TestCase):
+    """Test that the StreamBuffer streams its source faithfully.
+    """
+
+    def test_read_and_seek(self):
+        """Reads should return the source's bytes in order, across seeks"""
+        data = bytes(range(256)) * 100
+        stream = filetype.StreamBuffer(io.BytesIO(data), len(data), capacity=1024, chunk=256)
+
+        assert stream.read(10) == data[:10]
+        assert stream.seek(20000) == 20000
+        assert stream.read(300) == data[20000:20300]
+        assert stream.seek(-5, filetype.RW_SEEK_END) == len(data) - 5
+        assert stream.read(100) == data[-5:]
+        assert stream.read(100) == b""
+        stream.close()
+
+class TestPixelCache(unittest.TestCase):
+    """Test that decoded images are stored in and mapped back from the on-disk cache.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cachefile = os.path.join(self.root, "image.pixels")
+        self.target = SDL_CreateRGBSurface(0, 64, 64, 32, 0, 0, 0, 0)
+        self.renderer = SDL_CreateSoftwareRenderer(self.target)
+
+    def test_miss_then_hit(self):
+        """A missing buffer should be written on decode and used instead of decoding afterwards"""
+        image = filetype.ImageFile(png(5, 3), self.renderer, self.cachefile)
+        assert (image.width, image.height) == (5, 3)
+        assert os.path.getsize(self.cachefile) == filetype.PIXELCACHE_HEADER.size + 5 * 4 * 3
+
+        with mock.patch('filetype.decode_image') as decode:
+            image = filetype.ImageFile(png(5, 3), self.renderer, self.cachefile)
+            assert not decode.called
+        assert (image.width, image.height) == (5, 3)
+
+    def test_corrupt(self):
+        """Truncated and mismatched buffers should be decoded again and replaced"""
+        for contents in [b"DW", b"DWPX" + bytes(12), filetype.PIXELCACHE_HEADER.pack(b"DWPX", 5, 3, 20) + bytes(10)]:
+            with open(self.cachefile, "wb") as f:
+                f.write(contents)
+
+            image = filetype.ImageFile(png(5, 3), self.renderer, self.cachefile)
+            assert (image.width, image.height) == (5, 3)
+            assert os.path.getsize(self.cachefile) == filetype.PIXELCACHE_HEADER.size + 5 * 4 * 3
+
+    def tearDown(self):
+        SDL_DestroyRenderer(self.renderer)
+        SDL_FreeSurface(self.target)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+class TestAudioFiles(unittest.TestCase):
+    """Test that audio files load through SDL_mixer with the dummy audio driver.
+    """
+
+    def setUp(self):
+        SDL_InitSubSystem(SDL_INIT_AUDIO)
+        if Mix_OpenAudio(22050, MIX_DEFAULT_FORMAT, 1, 512) < 0:
+            self.skipTest("no audio device")
+
+    def test_sound_effect(self):
+        """Sound effects should be decoded entirely"""
+        sound = filetype.AudioFile(memoryview(bytearray(wav(1000))))
+        assert sound.chunk
+        assert sound.size > 0
+
+    def test_music_stream(self):
+        """Music should be streamed from a file-like source"""
+        data = wav(100000)
+        music = filetype.MusicFile(io.BytesIO(data), len(data), capacity=4096)
+        assert music.music
+
+    def tearDown(self):
+        Mix_CloseAudio()
+        SDL_QuitSubSystem(SDL_INIT_AUDIO)
@@ -0,0 +1,117 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_pathfinder.py            ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import time
+import types
+import unittest
+import unittest.mock as mock
+
+import pathfinder
+import tilemap
+
+# A 7x5 map with a wall down the middle, a gap at the bottom that only npcs may use, and a gap at the top that only
+# the player may use.
+MAP = [
+    ".  N  .",
+    ".  #  .",
+    ".  #  .",
+    ".  #  .",
+    ".  P  .",
+]
+
+def area():
+    """Create a mock AreaManager with a single layer built from MAP"""
+    rows = [row.replace("  ", "") for row in MAP]
+    a = mock.Mock()
+    a.tilemap.width = len(rows[0])
+    a.tilemap.height = len(rows)
+    nowalk = {".": None, "#": "", "N": "npc", "P": "player"}
+    tiles = [types.SimpleNamespace(seq=n, nowalk=nowalk[c]) for n, c in enumerate("".join(rows))]
+    a.tilemap.layers = [types.SimpleNamespace(tiles=tiles)]
+    return a
+
+class TestPathfinder(unittest.TestCase):
+    """Test that paths are found across the walkable tiles of a layer.
+    """
+
+    def test_find(self):
+        """Paths should go around walls through the gaps open to the entity"""
+        pf = pathfinder.Pathfinder(area())
+
+        npc = pf.find(0, (0, 2), (2, 2))
+        assert npc[-1] == (2, 2) and (1, 4) in npc and len(npc) == 6
+        player = pf.find(0, (0, 2), (2, 2), player=True)
+        assert (1, 0) in player and len(player) == 6
+
+        assert pf.find(0, (0, 2), (1, 2)) is None
+        assert pf.find(0, (0, 2), (0, 2)) == []
+
+    def test_flow_field(self):
+        """Flow fields should lead every reachable tile to the goal and be cached until invalidated"""
+        a = area()
+        pf = pathfinder.Pathfinder(a)
+
+        field = pf.flow_field(0, (2, 0))
+        assert field.distance(2, 0) == 0
+        assert field.distance(0, 0) == 10
+        assert field.direction(2, 4) == (0, -1)
+        assert field.direction(1, 2) is None
+        assert pf.flow_field(0, (2, 0)) is field
+
+        a.tilemap.layers[0].tiles[1].nowalk = None
+        pf.invalidate(0)
+        assert pf.flow_field(0, (2, 0)).distance(0, 0) == 2
+
+    def test_find_async(self):
+        """Background searches should be handed back from a tick callback"""
+        a = area()
+        pf = pathfinder.Pathfinder(a)
+        results = []
+
+        pf.find_async(0, (0, 0), (2, 4), results.append)
+        tick = a.driftwood.tick.register.call_args[0][0]
+        for n in range(100):
+            tick(10)
+            if results:
+                break
+            time.sleep(0.01)
+
+        assert results == [pf.find(0, (0, 0), (2, 4))]
+        a.driftwood.tick.unregister.assert_called_with(tick)
+
+    def test_nowalk_changes(self):
+        """Changing a tile's nowalk should rebuild its layer's grid"""
+        a = mock.Mock()
+        a.pathfinder = pathfinder.Pathfinder(a)
+        a.tilemap = tilemap.Tilemap(a)
+        a.tilemap._read({"width": 3, "height": 3, "tilewidth": 16, "tileheight": 16, "tilesets": [], "layers": [
+            {"type": "tilelayer", "visible": True, "data": [0] * 9}
+        ]})
+
+        assert a.pathfinder.grid(0) == bytes(9)
+        a.tilemap.layers[0].tile(1, 1).nowalk = ""
+        assert a.pathfinder.grid(0)[4] == 1
+        assert len(a.pathfinder.find(0, (1, 0), (1, 2))) == 4
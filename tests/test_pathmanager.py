@@ -0,0 +1,202 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_pathmanager.py           ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+import zipfile
+
+import pathmanager
+import resourcepack
+
+def driftwood(root, base):
+    """Create a mock, shared Driftwood object"""
+    d = mock.Mock()
+    d.config = {
+        'path': {
+            'self': base,
+            'root': root,
+            'path': []
+        }
+    }
+    d.log.msg.side_effect = Exception('log.msg called')
+    return d
+
+class TestPathManager(unittest.TestCase):
+    """Test that the PathManager builds its virtual filesystem correctly.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+        # A zip archive standing in for the base module.
+        self.base = os.path.join(self.root, "base.zip")
+        with zipfile.ZipFile(self.base, 'w') as zf:
+            zf.writestr("init.py", "")
+            zf.writestr("maps/area.json", "{}")
+
+        # A directory pathname.
+        os.makedirs(os.path.join(self.root, "dir", "sub"))
+        with open(os.path.join(self.root, "dir", "player.json"), 'w') as f:
+            f.write("{}")
+
+    def test_archive_pool(self):
+        """Archives should stay open and indexed between lookups"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+
+        zf = path.archive(self.base)
+        assert path.archive(self.base) is zf
+        assert path.zipinfo("maps/area.json", self.base).filename == "maps/area.json"
+        assert path.zipinfo("missing.json", self.base) is None
+
+    def test_archives_off_the_path_are_closed(self):
+        """Archives examined or read from outside the path should not stay in the pool"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+        other = os.path.join(self.root, "other.zip")
+        with zipfile.ZipFile(other, 'w') as zf:
+            zf.writestr("other.json", "{}")
+
+        assert path.examine(other) == ("other.json",)
+        assert other not in path._PathManager__archives
+
+        path.archive(other)
+        path.rebuild()
+        assert other not in path._PathManager__archives
+        assert self.base in path._PathManager__archives
+
+    def test_rebuild_keeps_unchanged_archives(self):
+        """Rebuilding the vfs should only reopen archives which changed"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+
+        zf = path.archive(self.base)
+        path.append(["dir"])
+        assert path.archive(self.base) is zf
+        assert path.find("player.json") == os.path.join(self.root, "dir")
+
+        with zipfile.ZipFile(self.base, 'a') as newzf:
+            newzf.writestr("new.json", "{}")
+        path.rebuild()
+        assert path.archive(self.base) is not zf
+        assert path.find("new.json") == self.base
+
+    def test_rebuild_forgets_removed(self):
+        """Removing a pathname should remove its files from the vfs"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+
+        path.append(["dir"])
+        path.remove(["dir"])
+        assert path.find("player.json") is None
+
+    def test_rebuild_rescans_changed_directories(self):
+        """Files added to a directory pathname should appear on rebuild"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+
+        path.append(["dir"])
+        with open(os.path.join(self.root, "dir", "sub", "npc.json"), 'w') as f:
+            f.write("{}")
+        path.rebuild()
+        assert path.find("sub/npc.json") == os.path.join(self.root, "dir")
+
+    def test_persisted_index(self):
+        """Listings should be persisted and reused when an index is configured"""
+        d = driftwood(self.root, self.base)
+        d.config['path']['index'] = os.path.join(self.root, "index.json")
+        d.config['path']['path'] = ["dir"]
+        pathmanager.PathManager(d)
+        assert os.path.isfile(d.config['path']['index'])
+
+        path = pathmanager.PathManager(d)
+        d.log.info.assert_called_with("Path", "rebuilt", "0 pathname(s) rescanned")
+        assert path.find("player.json") == os.path.join(self.root, "dir")
+
+    def test_persisted_index_off_path(self):
+        """Listings of pathnames which left the path should be kept and reused when they are added again"""
+        d = driftwood(self.root, self.base)
+        d.config['path']['index'] = os.path.join(self.root, "index.json")
+        path = pathmanager.PathManager(d)
+        path.append(["dir"])
+        path.remove(["dir"])
+
+        path.append(["dir"])
+        d.log.info.assert_called_with("Path", "rebuilt", "0 pathname(s) rescanned")
+        path.remove(["dir"])
+
+        path = pathmanager.PathManager(d)
+        path.append(["dir"])
+        d.log.info.assert_called_with("Path", "rebuilt", "0 pathname(s) rescanned")
+        assert path.find("player.json") == os.path.join(self.root, "dir")
+
+    def test_relative_paths(self):
+        """Files in subdirectories should be found by relative path in both directories and archives"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+        with open(os.path.join(self.root, "dir", "sub", "area.json"), 'w') as f:
+            f.write("{}")
+        path.append(["dir"])
+
+        assert path.find("sub/area.json") == os.path.join(self.root, "dir")
+        assert path.find("maps/area.json") == self.base
+        assert path.find("area.json") is None
+
+    def test_listdir_and_glob(self):
+        """Directory listings and glob queries should follow the vfs hierarchy"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+        with open(os.path.join(self.root, "dir", "sub", "area.json"), 'w') as f:
+            f.write("{}")
+        path.append(["dir"])
+
+        assert path.listdir() == ("init.py", "maps/", "player.json", "sub/")
+        assert path.listdir("maps") == ("area.json",)
+        assert path.glob("*.json") == ("player.json",)
+        assert path.glob("*/area.json") == ("maps/area.json", "sub/area.json")
+
+    def test_find_in_pathname(self):
+        """Pathname-scoped lookups should not examine pathnames on the path again"""
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+        path.append(["dir"])
+        dirpath = os.path.join(self.root, "dir")
+
+        with mock.patch.object(path, 'examine') as examine:
+            assert path.find("player.json", dirpath) == dirpath
+            assert path.find("init.py", dirpath) is None
+            assert path.find("init.py", self.base) == self.base
+            assert not examine.called
+
+    def test_resource_pack(self):
+        """Resource packs should be usable as pathnames"""
+        resourcepack.build(os.path.join(self.root, "dir"), os.path.join(self.root, "dir.dwp"))
+        path = pathmanager.PathManager(driftwood(self.root, self.base))
+        path.append(["dir.dwp"])
+        packpath = os.path.join(self.root, "dir.dwp")
+
+        assert path.kind(packpath) == "pack"
+        assert path.find("player.json") == packpath
+        assert bytes(path.pack(packpath).read("player.json")) == b"{}"
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,176 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_resourcemanager.py       ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import unittest.mock as mock
+
+from sdl2 import SDL_CreateRGBSurface, SDL_CreateSoftwareRenderer, SDL_DestroyRenderer, SDL_FreeSurface
+
+import cachemanager
+import pathmanager
+import resourcemanager
+from test_entitymanager import Ticker
+from test_filetype import png
+
+def driftwood(root, disk=""):
+    """Create a mock, shared Driftwood object with a real PathManager and CacheManager"""
+    d = mock.Mock()
+    d.config = {
+        'cache': {
+            'enabled': True,
+            'ttl': 300,
+            'disk': disk
+        },
+        'path': {
+            'self': os.path.join(root, "data"),
+            'root': root,
+            'path': []
+        },
+        'resource': {
+            'workers': 2,
+            'uploads': 1
+        }
+    }
+    d.log.msg.side_effect = Exception('log.msg called')
+    d.tick = Ticker()
+    d.path = pathmanager.PathManager(d)
+    d.cache = cachemanager.CacheManager(d)
+    return d
+
+class TestResourceManager(unittest.TestCase):
+    """Test that files are read, decoded and cached.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "data"))
+        self.target = SDL_CreateRGBSurface(0, 64, 64, 32, 0, 0, 0, 0)
+        self.renderer = SDL_CreateSoftwareRenderer(self.target)
+
+    def write(self, filename, contents, mtime=None):
+        pathname = os.path.join(self.root, "data", filename)
+        with open(pathname, "wb") as f:
+            f.write(contents)
+        if mtime:
+            os.utime(pathname, (mtime, mtime))
+
+    def test_request_many(self):
+        """Batched requests should return every file found, from the cache or read in parallel"""
+        d = driftwood(self.root)
+        for n in range(8):
+            self.write("{0}.json".format(n), "[{0}]".format(n).encode())
+        d.path.rebuild()
+        resource = resourcemanager.ResourceManager(d)
+        d.cache.upload("0.json", "cached")
+
+        results = resource.request_many(["{0}.json".format(n) for n in range(8)])
+        assert results["0.json"] == "cached"
+        assert results["7.json"] == "[7]"
+        assert len(results) == 8
+        assert d.cache.download("5.json") == "[5]"
+
+    def test_prefetch(self):
+        """Prefetched files should be in the cache when the batch callback is called"""
+        d = driftwood(self.root)
+        self.write("a.json", b"{}")
+        self.write("b.png", png(2, 2))
+        d.path.rebuild()
+        resource = resourcemanager.ResourceManager(d)
+        callback = mock.Mock()
+
+        resource.prefetch(["a.json", "b.png"], callback)
+        for t in range(500):
+            d.tick.tick(1)
+            if callback.called:
+                break
+            time.sleep(0.001)
+
+        callback.assert_called_once_with(("a.json", "b.png"))
+        assert d.cache.download("a.json") == "{}"
+        assert "b.png" in resource._ResourceManager__surfaces
+        assert resource._ResourceManager__prefetch_tick not in d.tick.callbacks
+
+    def test_request_image_async(self):
+        """Images should be decoded off the main loop and uploaded on ticks, at most the configured number per tick"""
+        d = driftwood(self.root)
+        d.window.renderer = self.renderer
+        for n in range(3):
+            self.write("{0}.png".format(n), png(n + 1, 1))
+        d.path.rebuild()
+        resource = resourcemanager.ResourceManager(d)
+        images = {}
+
+        for n in range(3):
+            assert resource.request_image_async("{0}.png".format(n), lambda image, n=n: images.update({n: image}))
+
+        for future in [job["future"] for job in resource._ResourceManager__decoding]:
+            future.result()
+        d.tick.tick(1)
+        assert len(images) == 1
+        d.tick.tick(1)
+        d.tick.tick(1)
+        assert {n: image.width for n, image in images.items()} == {0: 1, 1: 2, 2: 3}
+        assert resource._ResourceManager__image_tick not in d.tick.callbacks
+
+    def test_mapped_files(self):
+        """Memory maps of files in directories should not outlive the request that read them"""
+        d = driftwood(self.root)
+        d.window.renderer = self.renderer
+        self.write("a.png", png(2, 2))
+        d.path.rebuild()
+        resource = resourcemanager.ResourceManager(d)
+
+        assert isinstance(resource.request("a.png", True), memoryview)
+        assert d.cache.download("a.png") is None
+
+        image = resource.request_image("a.png")
+        assert image.width == 2
+        assert not hasattr(image, "_ImageFile__data")
+
+    def test_stale_disk_cache(self):
+        """A changed image should get a new entry in the on-disk cache rather than the old pixels"""
+        self.write("a.png", png(4, 4), 1000000000)
+        disk = os.path.join(self.root, "disk")
+        d = driftwood(self.root, disk)
+        d.window.renderer = self.renderer
+        resource = resourcemanager.ResourceManager(d)
+
+        assert resource.request_image("a.png").width == 4
+        assert len(os.listdir(disk)) == 1
+
+        self.write("a.png", png(6, 4), 1000000001)
+        d.cache.purge("a.png")
+        assert resource.request_image("a.png").width == 6
+        assert len(os.listdir(disk)) == 2
+
+    def tearDown(self):
+        SDL_DestroyRenderer(self.renderer)
+        SDL_FreeSurface(self.target)
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,97 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_resourcepack.py          ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import resourcepack
+
+class TestResourcePack(unittest.TestCase):
+    """Test that resource packs can be built and read back.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, "data")
+        os.makedirs(os.path.join(self.data, "maps"))
+
+        with open(os.path.join(self.data, "player.json"), 'w') as f:
+            f.write("{" + " " * 1000 + "}")
+        with open(os.path.join(self.data, "maps", "area.json"), 'w') as f:
+            f.write("{}")
+        with open(os.path.join(self.data, "empty"), 'w') as f:
+            pass
+
+        self.pack = os.path.join(self.root, "data.dwp")
+
+    def test_round_trip(self):
+        """Every file should be readable from the pack by its relative path"""
+        assert resourcepack.build(self.data, self.pack) == 3
+        assert resourcepack.ispack(self.pack)
+
+        pack = resourcepack.ResourcePack(self.pack)
+        assert sorted(pack.namelist()) == ["empty", "maps/area.json", "player.json"]
+        assert bytes(pack.read("player.json")) == b"{" + b" " * 1000 + b"}"
+        assert bytes(pack.read("maps/area.json")) == b"{}"
+        assert bytes(pack.read("empty")) == b""
+        assert "missing.json" not in pack
+
+    def test_stored_members_are_aligned_views(self):
+        """Uncompressed members should be page-aligned views into the pack"""
+        resourcepack.build(self.data, self.pack, compress=False)
+
+        pack = resourcepack.ResourcePack(self.pack)
+        assert isinstance(pack.read("player.json"), memoryview)
+
+    def test_not_a_pack(self):
+        """Other files should not be mistaken for packs"""
+        assert not resourcepack.ispack(os.path.join(self.data, "player.json"))
+        with self.assertRaises(ValueError):
+            resourcepack.ResourcePack(os.path.join(self.data, "player.json"))
+
+    def test_precompiled_scripts(self):
+        """Scripts should be packed with bytecode matching their source"""
+        with open(os.path.join(self.data, "npc.py"), 'w') as f:
+            f.write("answer = 42\n")
+        with open(os.path.join(self.data, "broken.py"), 'w') as f:
+            f.write("answer =\n")
+
+        skipped = []
+        assert resourcepack.build(self.data, self.pack, bytecode=True, skipped=skipped) == 6
+        assert skipped == ["broken.py"]
+
+        pack = resourcepack.ResourcePack(self.pack)
+        source = bytes(pack.read("npc.py"))
+        code = resourcepack.load_bytecode(bytes(pack.read("npc.pyc")), source)
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["answer"] == 42
+        assert resourcepack.load_bytecode(bytes(pack.read("npc.pyc")), b"answer = 43\n") is None
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,138 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_scriptmanager.py         ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import pathmanager
+import scriptmanager
+
+def driftwood(root):
+    """Create a mock, shared Driftwood object"""
+    d = mock.Mock()
+    d.config = {
+        'path': {
+            'self': os.path.join(root, "data"),
+            'root': root,
+            'path': []
+        },
+        'script': {
+            'bytecode': os.path.join(root, "bytecode")
+        }
+    }
+    d.log.msg.side_effect = Exception('log.msg called')
+    d.path = pathmanager.PathManager(d)
+    return d
+
+class TestScriptManager(unittest.TestCase):
+    """Test that scripts are loaded, called and cached.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "data"))
+        self.write(1)
+
+    def write(self, value):
+        with open(os.path.join(self.root, "data", "events.py"), 'w') as f:
+            f.write("calls = []\ndef on_tile(arg=None):\n    calls.append(arg)\n    return {0}\n".format(value))
+
+    def test_hook_is_resolved_once(self):
+        """Handles should call through to the function and follow the script across unloads"""
+        d = driftwood(self.root)
+        script = scriptmanager.ScriptManager(d)
+
+        hook = script.hook("events.py", "on_tile")
+        assert script.hook("events.py", "on_tile") is hook
+        assert hook() == 1
+        assert hook("npc") == 1
+        assert script.module("events.py").calls == [None, "npc"]
+
+        self.write(2)
+        script.unload("events.py")
+        assert hook() == 2
+        assert script.call("events.py", "on_tile") == 2
+
+    def test_event_argument(self):
+        """Three part event properties should pass their argument, unless the caller passes its own"""
+        script = scriptmanager.ScriptManager(driftwood(self.root))
+
+        hook = script.event("events.py:on_tile:door")
+        assert script.event("events.py:on_tile:door") is hook
+        assert script.event("events.py:on_tile") is not hook
+        assert hook() == 1
+        assert hook("npc") == 1
+        script.event("events.py:on_tile")()
+        assert script.module("events.py").calls == ["door", "npc", None]
+
+    def test_modules_are_registered(self):
+        """Loaded scripts should be importable by other scripts"""
+        with open(os.path.join(self.root, "data", "caller.py"), 'w') as f:
+            f.write("import events\ndef call():\n    return events.on_tile()\n")
+        script = scriptmanager.ScriptManager(driftwood(self.root))
+
+        assert script.call("events.py", "on_tile") == 1
+        assert script.call("caller.py", "call") == 1
+        assert script.module("events.py").calls == [None, None]
+
+    def test_bytecode_cache(self):
+        """Scripts should be compiled once and loaded from the bytecode cache afterwards"""
+        script = scriptmanager.ScriptManager(driftwood(self.root))
+        assert script.call("events.py", "on_tile") == 1
+        assert len(os.listdir(os.path.join(self.root, "bytecode"))) == 1
+
+        with mock.patch('resourcepack.compile_bytecode') as compiler:
+            script = scriptmanager.ScriptManager(driftwood(self.root))
+            assert script.call("events.py", "on_tile") == 1
+            assert not compiler.called
+
+    def test_budget(self):
+        """Slow calls should be measured, and calls past the tick's budget deferred to the next tick"""
+        with open(os.path.join(self.root, "data", "slow.py"), 'w') as f:
+            f.write("import time\ndef slow():\n    time.sleep(0.005)\n    return True\n")
+        d = driftwood(self.root)
+        d.config['script'].update({'budget': 1, 'defer': True})
+        script = scriptmanager.ScriptManager(d)
+        tick = d.tick.register.call_args[0][0]
+
+        assert script.call("slow.py", "slow") is not None
+        assert script.call("slow.py", "slow") is None
+        stats = script.stats("slow.py:slow")
+        assert stats["calls"] == 1 and stats["over"] == 1 and stats["deferred"] == 1
+        assert stats["max"] >= 5
+        assert d.log.warn.call_args[0][:3] == ("WARNING", "Script", "over budget")
+
+        tick(10)
+        assert script.stats("slow.py:slow")["calls"] == 2
+
+    def tearDown(self):
+        for name in ["events", "caller", "slow"]:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.root, ignore_errors=True)
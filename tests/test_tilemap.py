@@ -0,0 +1,113 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_tilemap.py               ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import unittest
+import unittest.mock as mock
+
+import areamanager
+import entitymanager
+import test_entitymanager
+import tilemap
+
+def objects(*objs):
+    """Create an object layer from (type, x, y, properties) tuples of one tile objects"""
+    return {"type": "objectgroup", "visible": True, "objects": [
+        {"type": t, "x": x, "y": y, "width": 16, "height": 16, "properties": p} for t, x, y, p in objs
+    ]}
+
+class TestTilemap(unittest.TestCase):
+    """Test that maps are read into layers, tiles and entities.
+    """
+
+    def test_entity_spawns(self):
+        """Entity objects should be spawned with one bulk insertion per descriptor and not merged into their tiles"""
+        area = mock.Mock()
+        area.driftwood.log.msg.side_effect = Exception('log.msg called')
+        area.driftwood.entity.insert_many.return_value = []
+        tiles = {"type": "tilelayer", "visible": True, "data": [0] * 16}
+        tm = tilemap.Tilemap(area)
+
+        tm._read({"width": 4, "height": 4, "tilewidth": 16, "tileheight": 16, "tilesets": [], "layers": [
+            objects(("entity", 0, 0, {"entity": "sign.json"})),
+            tiles,
+            objects(("entity", 16, 0, {"entity": "npc.json"}), ("", 0, 16, {"nowalk": ""})),
+            tiles,
+            objects(("entity", 32, 32, {"entity": "npc.json"})),
+        ]})
+
+        insert_many = area.driftwood.entity.insert_many
+        assert insert_many.call_count == 2
+        insert_many.assert_any_call("npc.json", [(0, 16, 0), (1, 32, 32)])
+        insert_many.assert_any_call("sign.json", [(0, 0, 0)])
+
+        assert tm.layers[0].tile(0, 1).nowalk == ""
+        assert tm.layers[0].tile(1, 0).properties == {}
+
+    @mock.patch('entity.spritesheet.Spritesheet', mock.Mock())
+    @mock.patch('areamanager.AreaManager._AreaManager__build_frame', mock.Mock())
+    @mock.patch('areamanager.AreaManager._AreaManager__prepare_frame', mock.Mock())
+    def test_refocus(self):
+        """Focusing an area again should replace the entities it spawned rather than add to them"""
+        d = test_entitymanager.driftwood()
+        npc = d.resource.request_json.return_value
+        d.resource = mock.MagicMock()
+        d.resource.__contains__.return_value = True
+        area = {"width": 4, "height": 4, "tilewidth": 16, "tileheight": 16, "tilesets": [], "layers": [
+            {"type": "tilelayer", "visible": True, "data": [0] * 16},
+            objects(("entity", 0, 0, {"entity": "npc.json"}), ("entity", 16, 0, {"entity": "npc.json"})),
+        ]}
+        d.resource.request_json.side_effect = lambda filename: area if filename == "area.json" else npc
+        d.area = areamanager.AreaManager(d)
+        d.entity = entitymanager.EntityManager(d)
+
+        assert d.area.focus("area.json")
+        assert len(d.entity.entities) == 2
+        assert d.area.focus("area.json")
+        assert len(d.entity.entities) == 2
+        assert sorted(d.area.tilemap.spawned) == sorted(ent.eid for ent in d.entity.entities)
+
+    @mock.patch('entity.spritesheet.Spritesheet', mock.Mock())
+    @mock.patch('areamanager.AreaManager._AreaManager__build_frame', mock.Mock())
+    @mock.patch('areamanager.AreaManager._AreaManager__prepare_frame', mock.Mock())
+    def test_missing_descriptor(self):
+        """An entity object naming a missing descriptor should be reported and skipped"""
+        d = test_entitymanager.driftwood()
+        d.log.msg.side_effect = None
+        npc = d.resource.request_json.return_value
+        d.resource = mock.MagicMock()
+        d.resource.__contains__.return_value = True
+        area = {"width": 4, "height": 4, "tilewidth": 16, "tileheight": 16, "tilesets": [], "layers": [
+            {"type": "tilelayer", "visible": True, "data": [0] * 16},
+            objects(("entity", 0, 0, {"entity": "missing.json"}), ("entity", 16, 0, {"entity": "npc.json"})),
+        ]}
+        descriptors = {"area.json": area, "npc.json": npc}
+        d.resource.request_json.side_effect = lambda filename: descriptors.get(filename)
+        d.area = areamanager.AreaManager(d)
+        d.entity = entitymanager.EntityManager(d)
+
+        assert d.area.focus("area.json")
+        d.log.msg.assert_called_once_with("ERROR", "Entity", "could not read descriptor", "missing.json")
+        assert [ent.filename for ent in d.entity.entities] == ["npc.json"]
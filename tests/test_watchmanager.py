@@ -0,0 +1,94 @@
+###################################
+## Driftwood 2D Game Dev. Suite  ##
+## test_watchmanager.py          ##
+## Copyright 2014 PariahSoft LLC ##
+###################################
+
+## **********
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to
+## deal in the Software without restriction, including without limitation the
+## rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+## sell copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in
+## all copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+## FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+## IN THE SOFTWARE.
+## **********
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import pathmanager
+import watchmanager
+
+def driftwood(root, inotify):
+    """Create a mock, shared Driftwood object"""
+    d = mock.Mock()
+    d.config = {
+        'path': {
+            'self': os.path.join(root, "data"),
+            'root': root,
+            'path': []
+        },
+        'watch': {
+            'enabled': True,
+            'inotify': inotify,
+            'interval': 0
+        }
+    }
+    d.log.msg.side_effect = Exception('log.msg called')
+    d.path = pathmanager.PathManager(d)
+    d.entity.spritesheet.return_value = None
+    d.area.filename = "area.json"
+    d.area.tilemap.tilesets = []
+    return d
+
+class TestWatchManager(unittest.TestCase):
+    """Test that the WatchManager reloads only what changed.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "data", "sub"))
+        for name in ["area.json", "npc.json"]:
+            with open(os.path.join(self.root, "data", name), 'w') as f:
+                f.write("{}")
+
+    def check_changes(self, inotify):
+        d = driftwood(self.root, inotify)
+        watch = watchmanager.WatchManager(d)
+        watch.tick(0)
+
+        with open(os.path.join(self.root, "data", "npc.json"), 'w') as f:
+            f.write("{\"changed\": true}")
+        with open(os.path.join(self.root, "data", "sub", "new.json"), 'w') as f:
+            f.write("{}")
+        watch.tick(0)
+
+        invalidated = sorted(call[0][0] for call in d.resource.invalidate.call_args_list)
+        assert invalidated == ["npc.json", "sub/new.json"]
+        assert d.path.find("sub/new.json") == os.path.join(self.root, "data")
+        assert not d.area.focus.called
+
+    def test_polling(self):
+        """Polling should find modified and added files"""
+        self.check_changes(False)
+
+    def test_inotify(self):
+        """Inotify, where available, should find modified and added files"""
+        self.check_changes(True)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)